@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Benchmark the crawler against a local stand-in for Google Search by Image and
+the fact checkers, so performance regressions can be caught without spending
+crawl budget.
+
+The stand-in serves synthetic result pages and fact checking articles (or
+recorded result pages, if given), with a configurable latency. The real
+collection code (scheduler.crawl_image, as used by collect_sources.py) runs
+against it, with every request rerouted to the stand-in.
+'''
+
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlsplit
+
+import google_crawler as gc
+import gzip
+import io
+import json
+import os
+import rate_limiter
+import scheduler
+import tracemalloc
+import zlib
+
+
+# Add command line arguments.
+parser = ArgumentParser()
+
+parser.add_argument('--images', type=int, default=50,
+                    help='Number of images to crawl.')
+parser.add_argument('--pages', type=int, default=10,
+                    help='Number of search result pages per image.')
+parser.add_argument('--results', type=int, default=10,
+                    help='Number of results per search result page.')
+parser.add_argument('--checked', type=float, default=0.3,
+                    help='Fraction of the images with fact checking '
+                    'articles among their sources.')
+parser.add_argument('--latency', type=float, default=0.05,
+                    help='Seconds the stand-in server waits before each '
+                    'response.')
+parser.add_argument('--page-kb', type=int, default=150,
+                    help='Size of the padding of each result page, in KB.')
+parser.add_argument('--workers', type=int, default=4,
+                    help='Number of images to crawl at the same time.')
+parser.add_argument('--rate', type=float, default=None,
+                    help='Maximum number of requests per second, over all '
+                    'hosts.')
+parser.add_argument('--sleep-min', type=float, default=0,
+                    help='Minimum number of seconds between requests to '
+                    'Google.')
+parser.add_argument('--sleep-max', type=float, default=0,
+                    help='Maximum number of seconds between requests to '
+                    'Google.')
+parser.add_argument('--recorded', type=str, default=None,
+                    help='Folder with recorded result pages, named '
+                    'results_<page>.html, served instead of synthetic ones.')
+parser.add_argument('--memory', action='store_true',
+                    help='Measure allocated memory (slows the benchmark '
+                    'down).')
+parser.add_argument('--output', type=str, default=None,
+                    help='Path of a JSON file to write the report to.')
+
+args = parser.parse_args()
+
+SEARCH_HOSTS = ['images.google.com.br', 'www.google.com.br']
+
+# Link to an article of each fact checker and its body, judging the content
+# as false.
+ARTICLES = {
+    'www.boatos.org': ('https://www.boatos.org/politica/{}.html',
+                       '<p>#boato</p>'),
+    'www.e-farsas.com': ('https://www.e-farsas.com/{}.html',
+                         '<span class="mvp-post-cat left">Falso</span>'),
+    'g1.globo.com': ('https://g1.globo.com/fato-ou-fake/noticia/{}.ghtml',
+                     '<h1 class="content-head__title">#FAKE</h1>'),
+    'piaui.folha.uol.com.br': ('https://piaui.folha.uol.com.br/lupa/{}/',
+                               '<div class="post-inner"><div class="etiqueta '
+                               'etiqueta-7"></div></div>'),
+    'aosfatos.org': ('https://aosfatos.org/noticias/{}/',
+                     '<figure><figcaption>falso</figcaption></figure>')
+}
+
+MARKER = 'Páginas que incluem imagens correspondentes'
+
+STATS = {'result_pages': 0, 'articles': 0, 'bytes': 0}
+STATS_LOCK = Lock()
+
+
+def is_checked(img_name):
+    '''
+        Check if an image has fact checking articles among its sources.
+
+        @img_name: (string) Image name.
+
+        @return: (bool) True iff the image was fact checked.
+    '''
+
+    return zlib.crc32(img_name.encode()) % 1000 < args.checked * 1000
+
+
+def build_result_page(img_name, page):
+    '''
+        Build a synthetic search result page.
+
+        @img_name: (string) Image name.
+        @page: (int) Page number, starting at 1.
+
+        @return: (string) Page HTML content.
+    '''
+
+    recorded = os.path.join(args.recorded or '',
+                            'results_{}.html'.format(page))
+
+    if args.recorded and os.path.exists(recorded):
+        with open(recorded, 'r') as recorded_file:
+            return recorded_file.read()
+
+    parts = ['<html><head><title>{}</title></head><body>'.format(img_name),
+             '<div>{}</div>'.format('x' * (args.page_kb * 1024)), MARKER]
+
+    for i in range(args.results):
+        link = 'http://site{}.com.br/{}/{}.html'.format(i, img_name, page)
+
+        if page == 1 and i < len(ARTICLES) and is_checked(img_name):
+            link = list(ARTICLES.values())[i][0].format(img_name)
+
+        parts.append('<div class="g"><div class="rc"><h3 class="r">'
+                     '<a href="{}">Result</a></h3><span class="st">'
+                     '<span class="f">{} de mar de 2018 - </span>Snippet'
+                     '</span></div></div>'.format(link, i + 1))
+
+    if page < args.pages:
+        parts.append('<a class="pn" id="pnnext" href="/search/{}?start={}">'
+                     'Next</a>'.format(img_name, page * 10))
+
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    '''
+        Request handler of the stand-in server. Serves Google Search by Image
+        and the fact checkers, telling them apart by the Host header.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *log_args):
+        pass
+
+    def do_GET(self):
+        sleep(args.latency)
+
+        host = self.headers.get('Host', '').split(':')[0]
+        parts = urlsplit(self.path)
+
+        if host == 'images.google.com.br':
+            img_name = parse_qs(parts.query)['image_url'][0].split('/')[-1]
+            self.send_response(302)
+            self.send_header('Location', 'https://www.google.com.br/search/'
+                             '{}?tbs=sbi&sa=X'.format(img_name))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if host == 'www.google.com.br':
+            img_name = parts.path.split('/')[-1]
+            start = int(parse_qs(parts.query).get('start', ['0'])[0])
+            body = build_result_page(img_name, start // 10 + 1)
+            counter = 'result_pages'
+        elif host in ARTICLES:
+            body = '<html><body>{}</body></html>'.format(ARTICLES[host][1])
+            counter = 'articles'
+        else:
+            self.send_error(404)
+            return
+
+        data = body.encode()
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, 6)
+
+        with STATS_LOCK:
+            STATS[counter] += 1
+            STATS['bytes'] += len(data)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server():
+    '''
+        Start the stand-in server on a free local port.
+
+        @return: (ThreadingHTTPServer) Running server.
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def timed(function, times):
+    '''
+        Wrap a function so the duration of each call is recorded.
+
+        @function: (function) Function to wrap.
+        @times: (float list) List the durations are appended to.
+
+        @return: (function) Wrapped function.
+    '''
+
+    def wrapper(*wrapper_args):
+        start = perf_counter()
+        result = function(*wrapper_args)
+        times.append(perf_counter() - start)
+        return result
+
+    return wrapper
+
+
+def summarize(times):
+    '''
+        Summarize a list of durations.
+
+        @times: (float list) Durations, in seconds.
+
+        @return: (dict) Number of samples, mean, median and maximum.
+    '''
+
+    if not times:
+        return {'count': 0, 'mean': 0, 'median': 0, 'max': 0}
+
+    times = sorted(times)
+    return {'count': len(times), 'mean': sum(times) / len(times),
+            'median': times[len(times) // 2], 'max': times[-1]}
+
+
+def run():
+    '''
+        Crawl the stand-in server and measure the crawler.
+
+        @return: (dict) Benchmark report.
+    '''
+
+    server = start_server()
+    address = '127.0.0.1:{}'.format(server.server_address[1])
+    gc.client.host_overrides = {host: address
+                                for host in SEARCH_HOSTS + list(ARTICLES)}
+
+    # The stand-in doesn't need politeness.
+    rate_limiter.DEFAULT_INTERVAL = (0, 0)
+
+    parse_times = []
+    fact_check_times = []
+    image_times = []
+
+    parse_result_page = gc.parse_result_page
+    get_fact_check = gc.get_fact_check
+    gc.parse_result_page = timed(parse_result_page, parse_times)
+    gc.get_fact_check = timed(get_fact_check, fact_check_times)
+
+    jobs = [('img{}.jpg'.format(i),
+             (gc.generate_link({'imageID': 'img{}.jpg'.format(i)}),
+              args.sleep_min, args.sleep_max, args.pages))
+            for i in range(args.images)]
+
+    if args.memory:
+        tracemalloc.start()
+
+    start = perf_counter()
+
+    try:
+        with redirect_stdout(io.StringIO()):
+            results = list(scheduler.crawl(
+                jobs, timed(scheduler.crawl_image, image_times),
+                args.workers, args.rate))
+    finally:
+        gc.parse_result_page = parse_result_page
+        gc.get_fact_check = get_fact_check
+        server.shutdown()
+
+    elapsed = perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[1] if args.memory else None
+
+    if args.memory:
+        tracemalloc.stop()
+
+    return {
+        'images': len(results),
+        'fact_checked': sum(1 for _, r in results if r['fact_checked']),
+        'elapsed': elapsed,
+        'result_pages': STATS['result_pages'],
+        'articles': STATS['articles'],
+        'bytes_received': STATS['bytes'],
+        'pages_per_second': STATS['result_pages'] / elapsed,
+        'parse_time': summarize(parse_times),
+        'fact_check_time': summarize(fact_check_times),
+        'image_time': summarize(image_times),
+        'peak_allocated_bytes': memory
+    }
+
+
+def main():
+    '''
+        Main function.
+    '''
+
+    report = run()
+
+    print('[+] Images: {} ({} fact checked)'.format(report['images'],
+                                                    report['fact_checked']))
+    print('[+] Elapsed: {:.3f} s'.format(report['elapsed']))
+    print('[+] Result pages: {} ({:.2f} pages/s)'.format(
+        report['result_pages'], report['pages_per_second']))
+    print('[+] Articles: {}'.format(report['articles']))
+    print('[+] Bytes received: {}'.format(report['bytes_received']))
+
+    for name in ('parse_time', 'fact_check_time', 'image_time'):
+        summary = report[name]
+        print('[+] {}: mean {:.2f} ms, median {:.2f} ms, max {:.2f} ms '
+              '({} samples)'.format(name, summary['mean'] * 1000,
+                                    summary['median'] * 1000,
+                                    summary['max'] * 1000, summary['count']))
+
+    if report['peak_allocated_bytes'] is not None:
+        print('[+] Peak allocated: {} bytes'.format(
+            report['peak_allocated_bytes']))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4, sort_keys=True)
+
+
+main()
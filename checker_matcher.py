@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Match URLs against a registry of fact checkers with a trie keyed by host
+labels (right to left) and then by path segments, so classifying a URL
+doesn't depend on the number of fact checkers.
+'''
+
+
+from url_utils import parse_url
+
+
+class Node:
+    '''
+        Trie node.
+    '''
+
+    __slots__ = ('children', 'paths', 'checker')
+
+    def __init__(self):
+        self.children = {}
+        self.paths = None
+        self.checker = None
+
+
+class CheckerMatcher:
+    '''
+        Precompiled matcher of fact checker URLs. A fact checker is written as
+        a host optionally followed by a path prefix, e.g., boatos.org or
+        g1.globo.com/fato-ou-fake. A URL matches it if its host is the
+        fact checker host or one of its subdomains, and its path starts with
+        the path prefix.
+    '''
+
+    def __init__(self, checkers):
+        '''
+            @checkers: (string list) Fact checkers.
+        '''
+
+        self._root = Node()
+
+        for checker in checkers:
+            host, _, path = checker.partition('/')
+            node = self._root
+
+            for label in reversed(host.lower().split('.')):
+                node = node.children.setdefault(label, Node())
+
+            if node.paths is None:
+                node.paths = Node()
+
+            node = node.paths
+
+            for segment in path.split('/') if path else []:
+                node = node.children.setdefault(segment, Node())
+
+            node.checker = checker
+
+    def match(self, url):
+        '''
+            Get the fact checker of a URL.
+
+            @url: (string) URL.
+
+            @return: (string) Most specific fact checker matching the URL, or
+                None if there's none.
+        '''
+
+        parsed = parse_url(url)
+        match = None
+        node = self._root
+
+        for label in reversed(parsed.host.split('.')):
+            node = node.children.get(label)
+
+            if node is None:
+                break
+
+            if node.paths is not None:
+                path_node = node.paths
+                match = path_node.checker or match
+
+                for segment in parsed.path:
+                    path_node = path_node.children.get(segment)
+
+                    if path_node is None:
+                        break
+
+                    match = path_node.checker or match
+
+        return match
+
+    def classify(self, links):
+        '''
+            Group links by fact checker.
+
+            @links: (string list) Links.
+
+            @return: (dict) Dict mapping each matched fact checker to its
+                links, in their original order.
+        '''
+
+        checker_links = {}
+
+        for link in links:
+            checker = self.match(link)
+
+            if checker is not None:
+                checker_links.setdefault(checker, []).append(link)
+
+        return checker_links
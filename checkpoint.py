@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Append-only checkpoint journal of a collection run. Each line records the
+result of one finished image, so an interrupted run can be resumed without
+crawling those images again.
+'''
+
+
+import json
+import os
+
+
+def get_journal_path(output_path):
+    '''
+        Get the path of the journal of an output file.
+
+        @output_path: (string) Path of the output file.
+
+        @return: (string) Path of the journal.
+    '''
+
+    return output_path + '.journal'
+
+
+def load(path):
+    '''
+        Load the results recorded in a journal.
+
+        @path: (string) Path of the journal.
+
+        @return: (dict) Dict mapping each finished image to its result. Empty
+            if there's no journal.
+    '''
+
+    results = {}
+
+    if not os.path.exists(path):
+        return results
+
+    with open(path, 'r') as journal:
+        for line in journal:
+            try:
+                entry = json.loads(line)
+            except ValueError:  # Last line cut short by a crash.
+                continue
+
+            results[entry['img_id']] = entry['result']
+
+    return results
+
+
+class Journal:
+    '''
+        Checkpoint journal open for appending.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) Path of the journal.
+        '''
+
+        self.path = path
+        self._file = open(path, 'a')
+
+        # Terminate a last line cut short by a crash.
+        if self._file.tell() > 0:
+            with open(path, 'rb') as journal:
+                journal.seek(-1, os.SEEK_END)
+
+                if journal.read() != b'\n':
+                    self._file.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, img_id, result):
+        '''
+            Record the result of a finished image. Written to disk before
+            returning.
+
+            @img_id: (string) Image key in the input file.
+            @result: (dict) Fields collected for the image.
+        '''
+
+        self._file.write(json.dumps({'img_id': img_id, 'result': result}) +
+                         '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        '''
+            Close the journal.
+        '''
+
+        self._file.close()
+
+    def remove(self):
+        '''
+            Close and delete the journal, once its output file is written.
+        '''
+
+        self.close()
+        os.remove(self.path)
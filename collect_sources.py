@@ -10,10 +10,17 @@ files describing a set of images.
 
 
 from argparse import ArgumentParser
+from egress_pool import EgressPool
+from http_cache import HTTPCache
+from image_dedup import find_duplicates
+from verdict_store import VerdictStore
 
+import checkpoint
 import google_crawler as gc
-import json
+import json_stream
+import metrics
 import os
+import scheduler
 
 
 # Add command line arguments.
@@ -27,11 +34,55 @@ parser.add_argument('min_share', type=int,
 parser.add_argument('pages', type=int,
                     help='Number of search result pages to go through.')
 parser.add_argument('sleep_min', type=float,
-                    help='Minimum number of seconds to sleep between \
-                    requests.')
+                    help='Minimum number of seconds between requests to \
+                    Google.')
 parser.add_argument('sleep_max', type=float,
-                    help='Maximum number of seconds to sleep between \
-                    requests.')
+                    help='Maximum number of seconds between requests to \
+                    Google.')
+parser.add_argument('--workers', type=int, default=1,
+                    help='Number of images to crawl at the same time.')
+parser.add_argument('--rate', type=float, default=None,
+                    help='Maximum number of requests per second, over all '
+                    'hosts.')
+parser.add_argument('--egress', type=str, default='',
+                    help='Comma separated egress points requests are sent '
+                    'through: proxy URLs (http:// or socks5://) or local IP '
+                    'addresses. Each one gets its own request budget, so '
+                    'crawl at least as many images at a time as there are '
+                    'egress points.')
+parser.add_argument('--cache', type=str, default='http_cache.sqlite',
+                    help='Path of the on-disk HTTP response cache. An empty '
+                    'path disables the cache.')
+parser.add_argument('--verdicts', type=str, default='verdicts.sqlite',
+                    help='Path of the persistent fact checker judgments '
+                    'store. An empty path disables the store.')
+parser.add_argument('--metrics', type=str, default='',
+                    help='Path of a metrics file, rewritten every minute: '
+                    'JSON if it ends with .json, Prometheus text format '
+                    'otherwise. An empty path disables it.')
+parser.add_argument('--metrics-port', type=int, default=None,
+                    help='Port to serve metrics on, in Prometheus text '
+                    'format.')
+parser.add_argument('--jsonl', action='store_true',
+                    help='Write each image to a JSON Lines output file as '
+                    'soon as it is finished, instead of writing a single '
+                    'JSON dict at the end.')
+parser.add_argument('--novelty', type=float, default=None,
+                    help='Stop going through the result pages of an image '
+                    'once the fraction of new registrable domains among the '
+                    'sources of a page falls below this threshold, or once a '
+                    'page has no new domains.')
+parser.add_argument('--stop-at-fact-check', action='store_true',
+                    help='Stop going through the result pages of an image '
+                    'once a fact checker link is found.')
+parser.add_argument('--images', type=str, default=None,
+                    help='Path of the folder with the image files. If given, '
+                    'images with the same contents are only searched for '
+                    'once.')
+parser.add_argument('--distance', type=int, default=None,
+                    help='Also search for near-duplicate images only once: '
+                    'maximum number of different bits between their '
+                    'perceptual hashes. Requires --images and Pillow.')
 
 args = parser.parse_args()
 
@@ -46,6 +97,60 @@ def init():
     if not os.path.exists(SOURCES_FOLDER):
         os.makedirs(SOURCES_FOLDER)
 
+    if args.cache:
+        gc.set_cache(HTTPCache(args.cache))
+
+    if args.verdicts:
+        gc.set_verdict_store(VerdictStore(args.verdicts))
+
+    if args.metrics:
+        metrics.start_writer(args.metrics)
+
+    if args.metrics_port is not None:
+        metrics.start_server(args.metrics_port)
+
+    gc.set_pagination(args.novelty, args.stop_at_fact_check)
+
+    egress = [spec for spec in args.egress.split(',') if spec]
+
+    if egress:
+        gc.set_egress_pool(EgressPool(egress, gc.client.headers, args.rate))
+
+
+def get_duplicates(json_f_path):
+    '''
+        Find duplicates among the images of a JSON file that need to be
+        crawled.
+
+        @json_f_path: (string) Path of the JSON file.
+
+        @return: (dict) Dict mapping each image ID to the ID of the image
+            searched for in its place.
+    '''
+
+    if not args.images:
+        return {}
+
+    image_ids = (img_data['imageID'] for _, img_data
+                 in json_stream.iter_records(json_f_path)
+                 if img_data['shareNumber'] >= args.min_share)
+
+    return find_duplicates(image_ids, args.images, args.distance)
+
+
+def get_job_args(img_data, previous):
+    '''
+        Get the arguments of the crawl of an image.
+
+        @img_data: (dict) JSON dict with the image data.
+        @previous: (dict) Indexed result of the image, unused.
+
+        @return: (tuple) Arguments of scheduler.crawl_image.
+    '''
+
+    return (gc.generate_link(img_data), args.sleep_min, args.sleep_max,
+            args.pages)
+
 
 def collect_sources():
     '''
@@ -56,42 +161,32 @@ def collect_sources():
     json_filenames = []
     for json_f in os.listdir(args.json_folder):
         if os.path.isfile(os.path.join(args.json_folder, json_f)):
-            if json_f.endswith('.json'):
+            if json_f.endswith('.json') or json_f.endswith('.jsonl'):
                 json_filenames.append(json_f)
 
     # Generate sources.
     for json_f in sorted(json_filenames):
         print('[+] File {}'.format(json_f))
         json_f_path = os.path.join(args.json_folder, json_f)
-
-        json_file = open(json_f_path, 'r')
-        imgs_data = json.load(json_file)
-        json_file.close()
-
-        links = gc.generate_links(imgs_data)
-
-        for img_id in links:
-            img_name = imgs_data[img_id]['imageID']
-            print('\t[+] Image {}'.format(img_name))
-
-            if imgs_data[img_id]['shareNumber'] >= args.min_share:
-                sources = gc.get_sources(
-                    links[img_id], args.sleep_min, args.sleep_max, args.pages)
-                imgs_data[img_id]['sources'] = sources
-
-                fact_checked = gc.is_fact_checked(sources)
-                imgs_data[img_id]['fact_checked'] = fact_checked
-
-                if fact_checked:
-                    imgs_data[img_id]['fact_check'] = gc.get_fact_check(
-                        sources, args.sleep_min, args.sleep_max)
-
-        output_file = open(os.path.join(SOURCES_FOLDER, json_f), 'w')
-
-        json.dump({int(x): imgs_data[x] for x in imgs_data.keys(
-        )}, output_file, indent=4, sort_keys=True)
-
-        output_file.close()
+        output_name = os.path.splitext(json_f)[0] + \
+            ('.jsonl' if args.jsonl else '.json')
+        output_path = os.path.join(SOURCES_FOLDER, output_name)
+        journal_path = checkpoint.get_journal_path(output_path)
+
+        # Finished by a previous run. Files with images left for a later run
+        # keep their journal.
+        if os.path.exists(output_path) and not os.path.exists(journal_path):
+            continue
+
+        duplicates = get_duplicates(json_f_path)
+        deferred = scheduler.crawl_file(
+            json_f_path, output_path, duplicates, scheduler.crawl_image,
+            get_job_args, args.workers, args.rate, args.min_share,
+            log=lambda line: print('\t' + line))
+
+        if deferred:
+            print('[-] {} images of {} left for a later run.'.format(
+                deferred, json_f))
 
 
 def main():
@@ -11,13 +11,15 @@ describing a set of images.
 
 from argparse import ArgumentParser
 from bs4 import BeautifulSoup
-from contextlib import closing
-from datetime import date, timedelta
+from date_parser import parse_date
+from http_client import HTTPClient
 from json import dump
 from time import sleep
 from random import uniform
+from retry import FetchError, RetryPolicy
+from url_utils import get_host
 
-import urllib.request
+import retry
 
 
 # Add command line arguments.
@@ -45,10 +47,10 @@ DOMAIN = 'www.google.com.br'
 USER_AGENT = '''Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 \
 (KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36'''
 
-MONTHS = {y: (x + 1) for (x, y) in enumerate(['jan', 'fev', 'mar',
-                                              'abr', 'mai', 'jun',
-                                              'jul', 'ago', 'set',
-                                              'out', 'nov', 'dez'])}
+client = HTTPClient([('User-Agent', USER_AGENT)])
+
+# Retry policy of failed requests.
+RETRY = RetryPolicy()
 
 
 def process_url(url):
@@ -73,46 +75,18 @@ def get_html(url):
         @url: (string) URL.
 
         @return: (string) HTML string.
-    '''
-
-    url = process_url(url)
-    headers = [('User-Agent', USER_AGENT)]
-    opener = urllib.request.build_opener()
-    opener.addheaders = headers
-
-    try:
-        with closing(opener.open(url)) as open_url:
-            html = open_url.read().decode()
-    except urllib.error.HTTPError as http_error:
-        print(http_error, '\tURL:', url)
-        exit()
-
-    slow_down()
-    return html
-
 
-def parse_date(raw_date):
+        @raise: (FetchError) If the request failed for good.
     '''
-        Parse a raw date string and return a formatted date string.
 
-        @raw_date: (string) Raw date string.
-
-        @return: (string) Formatted date string.
-    '''
-
-    pieces = raw_date.split()
+    url = process_url(url)
 
-    if len(pieces) == 5:  # x de x de x
-        year = int(pieces[4])
-        month = MONTHS[pieces[2]]
-        day = int(pieces[0])
+    def fetch():
+        # Every attempt, retries included, keeps the crawler's pace.
+        slow_down()
+        return client.get(url)
 
-        return date(year, month, day).isoformat()
-    elif len(pieces) == 3:  # x x atrás
-        offset = int(pieces[0])
-        return (date.today() - timedelta(days=offset)).isoformat()
-    else:  # unknown
-        return ''
+    return retry.call(fetch, get_host(url), RETRY).get_text()
 
 
 def get_page_sources(html):
@@ -156,7 +130,7 @@ def get_next_page(html):
 
 def slow_down():
     '''
-        Sleeps for awhile after each request, so the crawler looks slightly
+        Sleeps for awhile before each request, so the crawler looks slightly
         more human.
     '''
 
@@ -171,13 +145,16 @@ def get_sources(url):
 
         @return: (string list) List of all the source links where the image has
         appeared on.
+
+        @raise: (FetchError) If a result page could not be fetched.
     '''
 
     html = get_html(url)
     sources = []
 
     # Only look for links where the image has appeared on.
-    html = html[html.find('Páginas que incluem imagens correspondentes'):]
+    start = html.find('Páginas que incluem imagens correspondentes')
+    html = html[start:] if start >= 0 else ''
 
     page = 1
     while True:  # Look for other sources in the rest of the result pages.
@@ -227,8 +204,12 @@ def collect_sources():
     # Collect sources
     for img_id in links:
         print('[+] Image {}'.format(img_id))
-        sources = get_sources(links[img_id])
-        imgs_sources[img_id] = sources
+
+        try:
+            imgs_sources[img_id] = get_sources(links[img_id])
+        except FetchError as error:
+            # Leave the image out rather than record it with no sources.
+            print('\t[-] Image {} skipped: {}'.format(img_id, error))
 
     csv_name = args.csv_filename.split('/')[-1]
     output_filename = csv_name[:csv_name.find('.')] + '_sources.json'
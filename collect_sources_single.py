@@ -11,13 +11,15 @@ file describing a set of images for a set of days.
 
 from argparse import ArgumentParser
 from bs4 import BeautifulSoup
-from contextlib import closing
-from datetime import date, timedelta
+from date_parser import parse_date
+from http_client import HTTPClient
 from time import sleep
 from random import uniform
+from retry import FetchError, RetryPolicy
+from url_utils import get_host
 
-import json
-import urllib.request
+import json_stream
+import retry
 
 
 # Add command line arguments.
@@ -31,6 +33,10 @@ parser.add_argument('sleep_min', type=float, default=31,
 parser.add_argument('sleep_max', type=float, default=35,
                     help='Maximum number of seconds to sleep between \
                     requests.')
+parser.add_argument('--jsonl', action='store_true',
+                    help='Write each image to a JSON Lines output file as '
+                    'soon as it is finished, instead of writing a single '
+                    'JSON dict at the end.')
 
 args = parser.parse_args()
 
@@ -42,10 +48,10 @@ DOMAIN = 'www.google.com.br'
 USER_AGENT = '''Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 \
 (KHTML, like Gecko) Chrome/68.0.3440.106 Safari/537.36'''
 
-MONTHS = {y: (x + 1) for (x, y) in enumerate(['jan', 'fev', 'mar',
-                                              'abr', 'mai', 'jun',
-                                              'jul', 'ago', 'set',
-                                              'out', 'nov', 'dez'])}
+client = HTTPClient([('User-Agent', USER_AGENT)])
+
+# Retry policy of failed requests.
+RETRY = RetryPolicy()
 
 
 def process_url(url):
@@ -70,46 +76,18 @@ def get_html(url):
         @url: (string) URL.
 
         @return: (string) HTML string.
-    '''
-
-    url = process_url(url)
-    headers = [('User-Agent', USER_AGENT)]
-    opener = urllib.request.build_opener()
-    opener.addheaders = headers
-
-    try:
-        with closing(opener.open(url)) as open_url:
-            html = open_url.read().decode()
-    except urllib.error.HTTPError as http_error:
-        print(http_error, '\tURL:', url)
-        exit()
-
-    slow_down()
-    return html
 
-
-def parse_date(raw_date):
-    '''
-        Parse a raw date string and return a formatted date string.
-
-        @raw_date: (string) Raw date string.
-
-        @return: (string) Formatted date string.
+        @raise: (FetchError) If the request failed for good.
     '''
 
-    pieces = raw_date.split()
+    url = process_url(url)
 
-    if len(pieces) == 5:  # x de x de x
-        year = int(pieces[4])
-        month = MONTHS[pieces[2]]
-        day = int(pieces[0])
+    def fetch():
+        # Every attempt, retries included, keeps the crawler's pace.
+        slow_down()
+        return client.get(url)
 
-        return date(year, month, day).isoformat()
-    elif len(pieces) == 3:  # x x atrás
-        offset = int(pieces[0])
-        return (date.today() - timedelta(days=offset)).isoformat()
-    else:  # unknown
-        return ''
+    return retry.call(fetch, get_host(url), RETRY).get_text()
 
 
 def get_page_sources(html):
@@ -153,7 +131,7 @@ def get_next_page(html):
 
 def slow_down():
     '''
-        Sleeps for awhile after each request, so the crawler looks slightly
+        Sleeps for awhile before each request, so the crawler looks slightly
         more human.
     '''
 
@@ -168,13 +146,16 @@ def get_sources(url):
 
         @return: (string list) List of all the source links where the image has
         appeared on.
+
+        @raise: (FetchError) If a result page could not be fetched.
     '''
 
     html = get_html(url)
     sources = []
 
     # Only look for links where the image has appeared on.
-    html = html[html.find('Páginas que incluem imagens correspondentes'):]
+    start = html.find('Páginas que incluem imagens correspondentes')
+    html = html[start:] if start >= 0 else ''
 
     page = 1
     while True:  # Look for other sources in the rest of the result pages.
@@ -190,46 +171,28 @@ def get_sources(url):
     return sources
 
 
-def generate_links(imgs_data):
-    '''
-        Generate Google Search by Image links.
-
-        @imgs_data: (dict) JSON dict with images data.
-
-        @return: (string list) List with the Google Search by Image links.
-    '''
-
-    links = {}
-    for img_n in imgs_data:
-        links[str(img_n)] = URL.format(imgs_data[str(img_n)]['imageID'])
-
-    return links
-
-
 def collect_sources():
     '''
         Collect sources where images have previously appeared on.
     '''
 
     print('[+] File {}'.format(args.json_file))
-    json_file = open(args.json_file, 'r')
-    imgs_data = json.load(json_file)
-    json_file.close()
-    links = generate_links(imgs_data)
-
-    for img_id in links:
-        img_name = imgs_data[img_id]['imageID']
-        print('\t[+] Image {}'.format(img_name))
-        sources = get_sources(links[img_id])
-        imgs_data[img_id]['sources'] = sources
-
-    output_name = args.json_file[:args.json_file.find('.')] + '_sources.json'
-    output_file = open(output_name, 'w')
-
-    json.dump({int(x): imgs_data[x] for x in imgs_data.keys(
-    )}, output_file, indent=4, sort_keys=True)
-
-    output_file.close()
+    output_name = args.json_file[:args.json_file.find('.')] + \
+        ('_sources.jsonl' if args.jsonl else '_sources.json')
+
+    with json_stream.open_writer(output_name) as writer:
+        for img_id, img_data in json_stream.iter_records(args.json_file):
+            print('\t[+] Image {}'.format(img_data['imageID']))
+
+            try:
+                img_data['sources'] = get_sources(
+                    URL.format(img_data['imageID']))
+            except FetchError as error:
+                # Mark the image as failed rather than as having no sources.
+                print('\t\t[-] {}'.format(error))
+                img_data['error'] = error.kind
+
+            writer.write(img_id, img_data)
 
 
 def main():
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Long-running crawl service. Takes images from the images queue of a SQLite
+job queue, collects and fact checks their sources, and puts the finished
+records in the results queue.
+
+Each image goes through three stages, each with its own pool of threads:
+fetch (download a search result page), parse (extract its sources and the
+next page link, sending the image back to fetch if there are more pages) and
+fact check. Only a bounded number of images are in the pipeline at a time,
+so a slow stage holds back the intake of new images instead of letting work
+pile up.
+'''
+
+
+from argparse import ArgumentParser
+from egress_pool import EgressPool
+from http_cache import HTTPCache
+from job_queue import JobQueue
+from queue import Queue
+from rate_limiter import RateLimiter
+from retry import FetchError
+from threading import Lock, Semaphore, Thread
+from time import sleep
+from verdict_store import VerdictStore
+
+import google_crawler as gc
+import json_stream
+import metrics
+import os
+import traceback
+
+
+# Add command line arguments.
+parser = ArgumentParser()
+
+parser.add_argument('queue', type=str,
+                    help='Path of the SQLite job queue.')
+parser.add_argument('pages', type=int,
+                    help='Number of search result pages to go through.')
+parser.add_argument('sleep_min', type=float,
+                    help='Minimum number of seconds between requests to \
+                    Google.')
+parser.add_argument('sleep_max', type=float,
+                    help='Maximum number of seconds between requests to \
+                    Google.')
+parser.add_argument('--feed', type=str, nargs='*', default=[],
+                    help='JSON files whose images are added to the images '
+                    'queue before starting, unless they are already in the '
+                    'images or results queue.')
+parser.add_argument('--min-share', type=int, default=2,
+                    help='Minimum share number of the fed images.')
+parser.add_argument('--novelty', type=float, default=None,
+                    help='Stop going through the result pages of an image '
+                    'once the fraction of new registrable domains among the '
+                    'sources of a page falls below this threshold, or once a '
+                    'page has no new domains.')
+parser.add_argument('--stop-at-fact-check', action='store_true',
+                    help='Stop going through the result pages of an image '
+                    'once a fact checker link is found.')
+parser.add_argument('--fetchers', type=int, default=4,
+                    help='Number of fetch stage threads.')
+parser.add_argument('--parsers', type=int, default=1,
+                    help='Number of parse stage threads.')
+parser.add_argument('--checkers', type=int, default=2,
+                    help='Number of fact check stage threads.')
+parser.add_argument('--in-flight', type=int, default=16,
+                    help='Maximum number of images in the pipeline.')
+parser.add_argument('--lease', type=float, default=3600,
+                    help='Number of seconds an image is reserved for this '
+                    'service. Images not finished by then are taken again.')
+parser.add_argument('--poll', type=float, default=5,
+                    help='Number of seconds between checks of an empty images '
+                    'queue.')
+parser.add_argument('--exit-when-empty', action='store_true',
+                    help='Stop once the images queue is empty, instead of '
+                    'waiting for new images.')
+parser.add_argument('--rate', type=float, default=None,
+                    help='Maximum number of requests per second, over all '
+                    'hosts.')
+parser.add_argument('--egress', type=str, default='',
+                    help='Comma separated egress points requests are sent '
+                    'through: proxy URLs (http:// or socks5://) or local IP '
+                    'addresses. Each one gets its own request budget, so '
+                    'keep at least as many fetchers as there are egress '
+                    'points.')
+parser.add_argument('--cache', type=str, default='http_cache.sqlite',
+                    help='Path of the on-disk HTTP response cache. An empty '
+                    'path disables the cache.')
+parser.add_argument('--verdicts', type=str, default='verdicts.sqlite',
+                    help='Path of the persistent fact checker judgments '
+                    'store. An empty path disables the store.')
+parser.add_argument('--metrics', type=str, default='',
+                    help='Path of a metrics file, rewritten every minute: '
+                    'JSON if it ends with .json, Prometheus text format '
+                    'otherwise. An empty path disables it.')
+parser.add_argument('--metrics-port', type=int, default=None,
+                    help='Port to serve metrics on, in Prometheus text '
+                    'format.')
+
+args = parser.parse_args()
+
+# Names of the queues images are taken from and results are put in.
+IMAGES_QUEUE = 'images'
+RESULTS_QUEUE = 'results'
+
+
+class Image:
+    '''
+        Image going through the pipeline.
+    '''
+
+    def __init__(self, job_id, key, img_id, img_data):
+        '''
+            @job_id: (int) ID of the job of the image in the images queue.
+            @key: (string) Job key of the image, if any.
+            @img_id: (string) Image key in its input file.
+            @img_data: (dict) Image record.
+        '''
+
+        self.job_id = job_id
+        self.key = key
+        self.img_id = img_id
+        self.img_data = img_data
+        self.url = gc.generate_link(img_data)
+        self.page = 1
+        self.html = None
+        self.sources = []
+        self.seen_domains = set()
+        self.stop_reason = None
+        self.egress = None
+
+
+class Service:
+    '''
+        Crawl service pipeline.
+    '''
+
+    def __init__(self, jobs):
+        '''
+            @jobs: (JobQueue) Job queue.
+        '''
+
+        self.jobs = jobs
+        self.fetch_queue = Queue()
+        self.parse_queue = Queue()
+        self.check_queue = Queue()
+
+        self._slots = Semaphore(max(args.in_flight, 1))
+        self._lock = Lock()
+        self._in_flight = 0
+
+    def run(self):
+        '''
+            Run the service until it's stopped or, with --exit-when-empty,
+            until the images queue is empty.
+        '''
+
+        stages = [(self.fetch_queue, self.fetch, args.fetchers),
+                  (self.parse_queue, self.parse, args.parsers),
+                  (self.check_queue, self.check, args.checkers)]
+        threads = []
+
+        for stage_queue, function, n_threads in stages:
+            for _ in range(max(n_threads, 1)):
+                thread = Thread(target=self.work, args=(stage_queue, function),
+                                daemon=True)
+                thread.start()
+                threads.append((stage_queue, thread))
+
+        self.intake()
+
+        for stage_queue, _ in threads:
+            stage_queue.put(None)
+
+        for _, thread in threads:
+            thread.join()
+
+    def intake(self):
+        '''
+            Take images from the images queue as pipeline slots become free.
+        '''
+
+        while True:
+            self._slots.acquire()
+            job = self.jobs.take(IMAGES_QUEUE, args.lease)
+
+            if job is not None:
+                job_id, payload = job
+                print('[+] Image {}'.format(payload['record']['imageID']))
+
+                with self._lock:
+                    self._in_flight += 1
+
+                self.fetch_queue.put(Image(job_id, payload.get('key'),
+                                           payload['img_id'],
+                                           payload['record']))
+                continue
+
+            self._slots.release()
+
+            with self._lock:
+                idle = self._in_flight == 0
+
+            if args.exit_when_empty and idle:
+                break
+
+            sleep(args.poll)
+
+    def work(self, stage_queue, function):
+        '''
+            Stage thread: run a stage function on the images of its queue.
+
+            @stage_queue: (Queue) Stage queue. None stops the thread.
+            @function: (function) Stage function.
+        '''
+
+        while True:
+            image = stage_queue.get()
+
+            if image is None:
+                break
+
+            try:
+                function(image)
+            except FetchError as error:
+                # Leave the image in the images queue, to be taken again once
+                # its lease expires, hopefully with its hosts back.
+                print('[-] Image {}: {}'.format(image.img_data['imageID'],
+                                                error))
+                self.release(image)
+            except Exception:
+                # Leave the image in the images queue, to be taken again once
+                # its lease expires.
+                traceback.print_exc()
+                self.release(image)
+
+    def fetch(self, image):
+        '''
+            Fetch stage: download the current result page of an image, going
+            through the same egress for all of its pages.
+
+            @image: (Image) Image.
+        '''
+
+        if gc.EGRESS is not None and image.egress is None:
+            image.egress = gc.EGRESS.acquire()
+
+        with gc.egress_session(image.egress):
+            if image.page == 1:
+                html = gc.get_html(image.url, args.sleep_min, args.sleep_max,
+                                   True, True)
+
+                # Only look for links where the image has appeared on.
+                image.html = gc.get_matching_pages(html)
+            else:
+                image.html = gc.get_html(image.url, args.sleep_min,
+                                         args.sleep_max, scan=True)
+
+        self.parse_queue.put(image)
+
+    def parse(self, image):
+        '''
+            Parse stage: collect the sources of the current result page of an
+            image, and send it to the next stage.
+
+            @image: (Image) Image.
+        '''
+
+        if image.page < args.pages:
+            page_sources, next_page_link, image.stop_reason = gc.paginate(
+                image.html, image.page, args.pages, image.seen_domains)
+            image.sources += page_sources
+            image.html = None
+            image.page += 1
+
+            if next_page_link is not None:
+                image.url = gc.DOMAIN + next_page_link
+                self.fetch_queue.put(image)
+                return
+
+        image.html = None
+        image.img_data['sources'] = image.sources
+        image.img_data['fact_checked'] = gc.is_fact_checked(image.sources)
+
+        if gc.NOVELTY is not None or gc.STOP_AT_FACT_CHECK:
+            image.img_data['pagination'] = gc.get_pagination_stats(
+                args.pages, image.page - 1, image.stop_reason)
+
+        if image.img_data['fact_checked']:
+            self.check_queue.put(image)
+        else:
+            self.finish(image)
+
+    def check(self, image):
+        '''
+            Fact check stage.
+
+            @image: (Image) Image.
+        '''
+
+        image.img_data['fact_check'] = gc.get_fact_check(
+            image.sources, args.sleep_min, args.sleep_max)
+        self.finish(image)
+
+    def finish(self, image):
+        '''
+            Put the record of a finished image in the results queue.
+
+            @image: (Image) Image.
+        '''
+
+        self.jobs.put(RESULTS_QUEUE, {'img_id': image.img_id,
+                                      'record': image.img_data}, image.key)
+        self.jobs.ack(image.job_id)
+        self.release(image)
+
+    def release(self, image):
+        '''
+            Free the pipeline slot and the egress of an image.
+
+            @image: (Image) Image.
+        '''
+
+        if image.egress is not None:
+            gc.EGRESS.release(image.egress)
+            image.egress = None
+
+        with self._lock:
+            self._in_flight -= 1
+
+        self._slots.release()
+
+
+def feed(jobs):
+    '''
+        Add the images of the fed JSON files to the images queue, skipping
+        the ones already in the images or results queue, e.g., when the
+        service is restarted with the same files.
+
+        @jobs: (JobQueue) Job queue.
+    '''
+
+    for path in args.feed:
+        for img_id, img_data in json_stream.iter_records(path):
+            if img_data['shareNumber'] < args.min_share:
+                continue
+
+            # Image keys are only unique within their input file.
+            key = '{}/{}'.format(os.path.basename(path), img_id)
+
+            if not jobs.has(RESULTS_QUEUE, key):
+                jobs.put(IMAGES_QUEUE, {'img_id': img_id, 'record': img_data,
+                                        'key': key}, key)
+
+
+def main():
+    '''
+        Main function.
+    '''
+
+    if args.cache:
+        gc.set_cache(HTTPCache(args.cache))
+
+    if args.verdicts:
+        gc.set_verdict_store(VerdictStore(args.verdicts))
+
+    if args.metrics:
+        metrics.start_writer(args.metrics)
+
+    if args.metrics_port is not None:
+        metrics.start_server(args.metrics_port)
+
+    gc.set_limiter(RateLimiter(args.rate))
+    gc.set_pagination(args.novelty, args.stop_at_fact_check)
+
+    egress = [spec for spec in args.egress.split(',') if spec]
+
+    if egress:
+        gc.set_egress_pool(EgressPool(egress, gc.client.headers, args.rate))
+
+    jobs = JobQueue(args.queue)
+    feed(jobs)
+    Service(jobs).run()
+    jobs.close()
+
+
+main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Normalize the dates Google shows in search results, in Portuguese or English,
+to ISO dates. Relative dates (e.g., 3 dias atrás) are anchored to the start of
+the run, so every result of a crawl is dated against the same day.
+'''
+
+
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import re
+
+
+# Maximum number of memoized raw dates.
+CACHE_SIZE = 1 << 14
+
+# Month of the first three letters of each Portuguese and English month name.
+MONTHS = {name: (x + 1) for names in (['jan', 'fev', 'mar', 'abr', 'mai',
+                                       'jun', 'jul', 'ago', 'set', 'out',
+                                       'nov', 'dez'],
+                                      ['jan', 'feb', 'mar', 'apr', 'may',
+                                       'jun', 'jul', 'aug', 'sep', 'oct',
+                                       'nov', 'dec'])
+          for (x, name) in enumerate(names)}
+
+# Time units of relative dates, by the words they are written as. Any other
+# word makes the date unparseable, e.g., the month of 12 dez.
+UNITS = {word: unit for words, unit in (
+    (['segundo', 'segundos', 'seg', 'second', 'seconds', 'sec', 'secs', 's'],
+     timedelta(seconds=1)),
+    (['minuto', 'minutos', 'minute', 'minutes', 'min', 'mins', 'm'],
+     timedelta(minutes=1)),
+    (['hora', 'horas', 'hour', 'hours', 'hr', 'hrs', 'h'],
+     timedelta(hours=1)),
+    (['dia', 'dias', 'day', 'days', 'd'], timedelta(days=1)),
+    (['semana', 'semanas', 'sem', 'week', 'weeks', 'wk', 'wks'],
+     timedelta(weeks=1)))
+    for word in words}
+
+# Days before the anchor day of relative dates written as words.
+WORDS = {'hoje': 0, 'today': 0, 'ontem': 1, 'yesterday': 1}
+
+# 12 de mar de 2018, 12 de mar. de 2018, 12 de março de 2018, 12 Mar 2018.
+DAY_MONTH_YEAR = re.compile(
+    r'^(\d{1,2})(?:\s+de)?\s+([a-zç]{3})[a-zç]*\.?(?:\s+de)?\s+(\d{4})$')
+
+# Mar 12, 2018, March 12 2018.
+MONTH_DAY_YEAR = re.compile(r'^([a-z]{3})[a-z]*\.?\s+(\d{1,2}),?\s+(\d{4})$')
+
+# 3 dias atrás, há 3 dias, há 1 semana, 2 horas atrás, 3 days ago, 5 mins ago.
+RELATIVE = re.compile(
+    r'^(?:há\s+)?(?:(\d+)|(?:um|uma|an?))\s+([a-z]+)\.?(?:\s+(?:atrás|ago))?$')
+
+# Time the relative dates are anchored to.
+NOW = datetime.now()
+
+
+def set_now(now):
+    '''
+        Set the time relative dates are anchored to, e.g., the start of a run.
+
+        @now: (datetime) Anchor time.
+    '''
+
+    global NOW
+    NOW = now
+    parse_date.cache_clear()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_date(raw_date):
+    '''
+        Parse a raw date string and return a formatted date string.
+
+        @raw_date: (string) Raw date string.
+
+        @return: (string) Formatted date string, empty if the date couldn't
+            be parsed.
+    '''
+
+    text = ' '.join(raw_date.lower().split())
+
+    try:
+        match = DAY_MONTH_YEAR.match(text)
+
+        if match is not None:
+            day, month, year = match.groups()
+            return date(int(year), MONTHS[month], int(day)).isoformat()
+
+        match = MONTH_DAY_YEAR.match(text)
+
+        if match is not None:
+            month, day, year = match.groups()
+            return date(int(year), MONTHS[month], int(day)).isoformat()
+    except (KeyError, ValueError):  # Unknown month or invalid day.
+        return ''
+
+    if text in WORDS:
+        return (NOW - timedelta(days=WORDS[text])).date().isoformat()
+
+    match = RELATIVE.match(text)
+
+    if match is not None:
+        count = int(match.group(1)) if match.group(1) else 1
+        unit = UNITS.get(match.group(2))
+
+        if unit is not None:
+            return (NOW - count * unit).date().isoformat()
+
+    return ''
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Pool of egress points (proxies or local IP addresses) the crawler sends its
+requests through. Each egress has its own HTTP client, with its own session
+cookies, and its own rate limiter, so every egress gets the full Google budget
+and the crawl speed grows with the number of egress points. A crawl session,
+e.g., all result pages of an image, sticks to a single egress.
+
+Also has a small forwarding HTTP proxy, to stand in for real proxies locally.
+'''
+
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http_client import HTTPClient
+from rate_limiter import RateLimiter
+from threading import Lock, Thread, local
+from time import monotonic
+from urllib.parse import urlsplit
+
+import http.client
+import select
+import socket
+
+
+# Weight of the latest outcome in the health score of an egress.
+HEALTH_WEIGHT = 0.2
+
+# Egress points whose health falls below MIN_HEALTH rest for REST seconds,
+# then get a new chance with MIN_HEALTH.
+MIN_HEALTH = 0.5
+REST = 600
+
+
+class Egress:
+    '''
+        Egress point.
+    '''
+
+    def __init__(self, spec, headers=None, rate=None):
+        '''
+            @spec: (string) Proxy URL (http:// or socks5://), local IP
+                address to make requests from, or direct.
+            @headers: ((string, string) list) Headers sent with every request.
+            @rate: (float) Maximum number of requests per second, over all
+                hosts. None means no global limit.
+        '''
+
+        self.name = spec
+        proxy = spec if '://' in spec else None
+        source_address = spec if proxy is None and spec != 'direct' else None
+
+        self.client = HTTPClient(headers, source_address=source_address,
+                                 proxy=proxy, cookies=True)
+        self.limiter = RateLimiter(rate)
+        self.health = 1.0
+        self.sessions = 0
+        self.resting_until = 0
+        self.requests = 0
+        self.blocks = 0
+
+
+class EgressPool:
+    '''
+        Thread-safe pool of egress points. New sessions go to the least busy
+        healthy egress.
+    '''
+
+    def __init__(self, specs, headers=None, rate=None):
+        '''
+            @specs: (string list) Egress points: proxy URLs (http:// or
+                socks5://), local IP addresses or direct.
+            @headers: ((string, string) list) Headers sent with every request.
+            @rate: (float) Maximum number of requests per second, over all
+                hosts, for each egress.
+        '''
+
+        self.egresses = [Egress(spec, headers, rate) for spec in specs]
+        self._lock = Lock()
+        self._bound = local()
+
+    def acquire(self):
+        '''
+            Pick an egress for a new session.
+
+            @return: (Egress) The egress with the fewest sessions among the
+                healthiest, or the one back from rest the soonest if all of
+                them are resting.
+        '''
+
+        now = monotonic()
+
+        with self._lock:
+            ready = [e for e in self.egresses if e.resting_until <= now]
+
+            if ready:
+                egress = min(ready, key=lambda e: (e.sessions, -e.health))
+            else:
+                egress = min(self.egresses, key=lambda e: e.resting_until)
+
+            egress.sessions += 1
+            return egress
+
+    def release(self, egress):
+        '''
+            End a session.
+
+            @egress: (Egress) Egress of the session.
+        '''
+
+        with self._lock:
+            egress.sessions -= 1
+
+    @contextmanager
+    def bind(self, egress):
+        '''
+            Send the requests of the current thread through an egress.
+
+            @egress: (Egress) Egress. None leaves the thread unbound.
+        '''
+
+        previous = getattr(self._bound, 'egress', None)
+        self._bound.egress = egress
+
+        try:
+            yield egress
+        finally:
+            self._bound.egress = previous
+
+    @contextmanager
+    def session(self):
+        '''
+            Acquire an egress and send the requests of the current thread
+            through it until the session ends.
+        '''
+
+        egress = self.acquire()
+
+        try:
+            with self.bind(egress):
+                yield egress
+        finally:
+            self.release(egress)
+
+    def current(self):
+        '''
+            Get the egress bound to the current thread.
+
+            @return: (Egress) Egress, None if the thread is unbound.
+        '''
+
+        return getattr(self._bound, 'egress', None)
+
+    def record(self, egress, healthy, blocked=False):
+        '''
+            Record the outcome of a request, updating the health score of its
+            egress.
+
+            @egress: (Egress) Egress the request went through.
+            @healthy: (bool) Whether the request succeeded.
+            @blocked: (bool) Whether the request was blocked.
+        '''
+
+        with self._lock:
+            egress.requests += 1
+            egress.blocks += blocked
+            egress.health += HEALTH_WEIGHT * (healthy - egress.health)
+
+            if egress.health < MIN_HEALTH:
+                print('\t\t[-] Egress {} is resting.'.format(egress.name))
+                egress.resting_until = monotonic() + REST
+                egress.health = MIN_HEALTH
+
+    def get_stats(self):
+        '''
+            Get the state of each egress.
+
+            @return: (dict) Dict mapping each egress name to its health,
+                number of requests and blocks, and whether it's resting.
+        '''
+
+        now = monotonic()
+
+        with self._lock:
+            return {e.name: {'health': e.health, 'requests': e.requests,
+                             'blocks': e.blocks,
+                             'resting': e.resting_until > now}
+                    for e in self.egresses}
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    '''
+        Forwarding HTTP proxy: GET requests with full URLs, and CONNECT
+        tunnels.
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path or '/'
+
+        if parts.query:
+            path += '?' + parts.query
+
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() not in ('connection', 'proxy-connection')}
+        upstream = http.client.HTTPConnection(parts.netloc, timeout=60)
+
+        try:
+            upstream.request('GET', path, headers=headers)
+            response = upstream.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.send_error(502)
+            return
+        finally:
+            upstream.close()
+
+        self.send_response(response.status)
+
+        for name, value in response.getheaders():
+            if name.lower() not in ('connection', 'content-length',
+                                    'transfer-encoding'):
+                self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_CONNECT(self):
+        host, _, port = self.path.rpartition(':')
+
+        try:
+            upstream = socket.create_connection((host, int(port)), 60)
+        except (OSError, ValueError):
+            self.send_error(502)
+            return
+
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+        sockets = [self.connection, upstream]
+
+        try:
+            while True:
+                readable, _, _ = select.select(sockets, [], [], 60)
+
+                if not readable:
+                    break
+
+                for sock in readable:
+                    data = sock.recv(1 << 16)
+
+                    if not data:
+                        return
+
+                    (upstream if sock is self.connection
+                     else self.connection).sendall(data)
+        finally:
+            upstream.close()
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+def start_proxy(port=0):
+    '''
+        Run a local forwarding HTTP proxy, in a background thread.
+
+        @port: (int) Port to listen on. 0 picks a free one.
+
+        @return: (ThreadingHTTPServer) Server. Its URL is
+            http://127.0.0.1:<server.server_port>.
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), ProxyHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
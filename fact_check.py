@@ -9,9 +9,12 @@ Fact check images according to their sources.
 
 
 from argparse import ArgumentParser
+from http_cache import HTTPCache
+from verdict_store import VerdictStore
 
 import google_crawler as gc
-import json
+import json_stream
+import metrics
 import os
 
 
@@ -21,11 +24,31 @@ parser = ArgumentParser()
 parser.add_argument('json_folder', type=str,
                     help='Path of the folder that contains the JSON files.')
 parser.add_argument('sleep_min', type=float,
-                    help='Minimum number of seconds to sleep between \
-                    requests.')
+                    help='Minimum number of seconds between requests to \
+                    Google.')
 parser.add_argument('sleep_max', type=float,
-                    help='Maximum number of seconds to sleep between \
-                    requests.')
+                    help='Maximum number of seconds between requests to \
+                    Google.')
+parser.add_argument('--cache', type=str, default='http_cache.sqlite',
+                    help='Path of the on-disk HTTP response cache. An empty '
+                    'path disables the cache.')
+parser.add_argument('--verdicts', type=str, default='verdicts.sqlite',
+                    help='Path of the persistent fact checker judgments '
+                    'store. An empty path disables the store.')
+parser.add_argument('--metrics', type=str, default='',
+                    help='Path of a metrics file, rewritten every minute: '
+                    'JSON if it ends with .json, Prometheus text format '
+                    'otherwise. An empty path disables it.')
+parser.add_argument('--metrics-port', type=int, default=None,
+                    help='Port to serve metrics on, in Prometheus text '
+                    'format.')
+parser.add_argument('--jsonl', action='store_true',
+                    help='Write each image to a JSON Lines output file as '
+                    'soon as it is checked, instead of writing a single JSON '
+                    'dict at the end.')
+parser.add_argument('--batch', type=int, default=20,
+                    help='Number of images whose fact checking articles are '
+                    'fetched at the same time.')
 
 args = parser.parse_args()
 
@@ -40,6 +63,39 @@ def init():
     if not os.path.exists(CHECK_FOLDER):
         os.makedirs(CHECK_FOLDER)
 
+    if args.cache:
+        gc.set_cache(HTTPCache(args.cache))
+
+    if args.verdicts:
+        gc.set_verdict_store(VerdictStore(args.verdicts))
+
+    if args.metrics:
+        metrics.start_writer(args.metrics)
+
+    if args.metrics_port is not None:
+        metrics.start_server(args.metrics_port)
+
+
+def check_batch(batch, writer):
+    '''
+        Fact check a batch of images at once, and write them.
+
+        @batch: ((string, dict) list) Key and record of each image.
+        @writer: (JSONWriter or JSONLinesWriter) Output record writer.
+    '''
+
+    checked = [img_data for _, img_data in batch
+               if img_data.get('fact_checked')]
+    fact_checks = gc.get_fact_checks([img_data['sources']
+                                      for img_data in checked],
+                                     args.sleep_min, args.sleep_max)
+
+    for img_data, fact_check in zip(checked, fact_checks):
+        img_data['fact_check'] = fact_check
+
+    for img_id, img_data in batch:
+        writer.write(img_id, img_data)
+
 
 def check():
     '''
@@ -50,33 +106,29 @@ def check():
     json_filenames = []
     for json_f in os.listdir(args.json_folder):
         if os.path.isfile(os.path.join(args.json_folder, json_f)):
-            if json_f.endswith('.json'):
+            if json_f.endswith('.json') or json_f.endswith('.jsonl'):
                 json_filenames.append(json_f)
 
     # Fact check.
     for json_f in sorted(json_filenames):
         print('[+] File {}'.format(json_f))
         json_f_path = os.path.join(args.json_folder, json_f)
+        output_name = os.path.splitext(json_f)[0] + \
+            ('.jsonl' if args.jsonl else '.json')
 
-        json_file = open(json_f_path, 'r')
-        imgs_data = json.load(json_file)
-        json_file.close()
-
-        for img_id in imgs_data:
-            img_name = imgs_data[img_id]['imageID']
-            print('\t[+] Image {}'.format(img_name))
-
-            if imgs_data[img_id].get('fact_checked'):
-                sources = imgs_data[img_id]['sources']
-                imgs_data[img_id]['fact_check'] = gc.get_fact_check(
-                    sources, args.sleep_min, args.sleep_max)
+        with json_stream.open_writer(os.path.join(CHECK_FOLDER,
+                                                  output_name)) as writer:
+            batch = []
 
-        output_file = open(os.path.join(CHECK_FOLDER, json_f), 'w')
+            for img_id, img_data in json_stream.iter_records(json_f_path):
+                print('\t[+] Image {}'.format(img_data['imageID']))
+                batch.append((img_id, img_data))
 
-        json.dump({int(x): imgs_data[x] for x in imgs_data.keys(
-        )}, output_file, indent=4, sort_keys=True)
+                if len(batch) >= args.batch:
+                    check_batch(batch, writer)
+                    batch = []
 
-        output_file.close()
+            check_batch(batch, writer)
 
 
 def main():
@@ -11,9 +11,17 @@ on a JSON file that describes these images.
 
 from argparse import ArgumentParser
 from datetime import datetime, timedelta
-from json import dump, load
+from egress_pool import EgressPool
+from http_cache import HTTPCache
+from image_dedup import find_duplicates
+from image_index import ImageIndex
+from retry import FetchError
+from verdict_store import VerdictStore
 
 import google_crawler as gc
+import json_stream
+import metrics
+import scheduler
 
 
 # Add command line arguments.
@@ -27,11 +35,62 @@ parser.add_argument('-s', type=int, default=2,
 parser.add_argument('-p', type=int, default=10,
                     help='Max number of search result pages per image.')
 parser.add_argument('-min', type=float, default=31,
-                    help='Minimum number of seconds to sleep between \
-                    requests.')
+                    help='Minimum number of seconds between requests to \
+                    Google.')
 parser.add_argument('-max', type=float, default=35,
-                    help='Maximum number of seconds to sleep between \
-                    requests.')
+                    help='Maximum number of seconds between requests to \
+                    Google.')
+parser.add_argument('-w', type=int, default=1,
+                    help='Number of images to crawl at the same time.')
+parser.add_argument('-r', type=float, default=None,
+                    help='Maximum number of requests per second, over all '
+                    'hosts.')
+parser.add_argument('-e', type=str, default='',
+                    help='Comma separated egress points requests are sent '
+                    'through: proxy URLs (http:// or socks5://) or local IP '
+                    'addresses. Each one gets its own request budget, so '
+                    'crawl at least as many images at a time as there are '
+                    'egress points.')
+parser.add_argument('-c', type=str, default='http_cache.sqlite',
+                    help='Path of the on-disk HTTP response cache. An empty '
+                    'path disables the cache.')
+parser.add_argument('-v', type=str, default='verdicts.sqlite',
+                    help='Path of the persistent fact checker judgments '
+                    'store. An empty path disables the store.')
+parser.add_argument('-m', type=str, default='',
+                    help='Path of a metrics file, rewritten every minute: '
+                    'JSON if it ends with .json, Prometheus text format '
+                    'otherwise. An empty path disables it.')
+parser.add_argument('-mp', type=int, default=None,
+                    help='Port to serve metrics on, in Prometheus text '
+                    'format.')
+parser.add_argument('-j', action='store_true',
+                    help='Write each image to a JSON Lines output file as '
+                    'soon as it is finished, instead of writing a single '
+                    'JSON dict at the end.')
+parser.add_argument('-i', type=str, default='image_index.sqlite',
+                    help='Path of the persistent index of crawled images. An '
+                    'empty path disables the index.')
+parser.add_argument('-f', type=float, default=7,
+                    help='Freshness window, in days. Images crawled within it '
+                    'are not crawled again, older ones only have their new '
+                    'sources collected.')
+parser.add_argument('-n', type=float, default=None,
+                    help='Stop going through the result pages of an image '
+                    'once the fraction of new registrable domains among the '
+                    'sources of a page falls below this threshold, or once a '
+                    'page has no new domains.')
+parser.add_argument('-fc', action='store_true',
+                    help='Stop going through the result pages of an image '
+                    'once a fact checker link is found.')
+parser.add_argument('-img', type=str, default=None,
+                    help='Path of the folder with the image files. If given, '
+                    'images with the same contents are only searched for '
+                    'once.')
+parser.add_argument('-dist', type=int, default=None,
+                    help='Also search for near-duplicate images only once: '
+                    'maximum number of different bits between their '
+                    'perceptual hashes. Requires -img and Pillow.')
 
 args = parser.parse_args()
 
@@ -51,71 +110,125 @@ def get_today_filename():
     return 'images_data_{}{:02}_Final.json'.format(month, day)
 
 
-def get_sources(url, log):
+def crawl_image(url, log, previous=None):
     '''
-        Get all source links where the image has appeared on.
+        Collect the sources of an image, and fact check them if needed.
 
-        @url: (string) HTML of the first result page for the image.
+        @url: (string) Google Search by Image link of the image.
         @log: (file) Log file.
-
-        @return: (string list) List of all the source links where the image has
-        appeared on.
+        @previous: (dict) Result of a previous crawl of the image, if any.
+            Only the sources it doesn't have are collected.
+
+        @return: (dict) Sources, fact_checked and, if the image was fact
+            checked, fact_check fields of the image. If a pagination policy
+            is set or the image is refreshed, also its pagination stats, in
+            the pagination field. If its result pages couldn't be fetched,
+            only an error field with the error class (blocked if Google
+            answered with a block page), so the image is deferred to a later
+            run instead of being recorded without sources.
     '''
 
-    html = gc.get_html(url, args.min, args.max, True)
-    sources = []
-
-    # Only look for links where the image has appeared on.
-    html = html[html.find('Páginas que incluem imagens correspondentes'):]
+    stats = {}
+    known = None if previous is None else \
+        {s[0] for s in previous['sources']}
 
-    page = 1
-    while True:  # Look for other sources in the rest of the result pages.
+    def log_page(page):
         log.write('\t[+] Search result page {}\n'.format(page))
-        page += 1
 
-        if page > args.p:
-            break
+    try:
+        sources = gc.get_sources(url, args.min, args.max, args.p, stats,
+                                 known, log_page)
+
+        if previous is not None:
+            sources = [s for s in sources if s[0] not in known]
+            sources += previous['sources']
+    except FetchError as error:
+        log.write('\t[-] {}\n'.format(error))
+        return {'error': error.kind}
+
+    fact_checked = gc.is_fact_checked(sources)
+    result = {'sources': sources, 'fact_checked': fact_checked}
+
+    if gc.NOVELTY is not None or gc.STOP_AT_FACT_CHECK or \
+            previous is not None:
+        result['pagination'] = stats
+
+    if fact_checked:
+        result['fact_check'] = gc.get_fact_check(sources, args.min, args.max)
 
-        sources += gc.get_page_sources(html)
-        html = gc.get_next_page(html, args.min, args.max)
+    return result
+
+
+def get_duplicates(input_filename):
+    '''
+        Find duplicates among the images of the input file that need to be
+        crawled.
+
+        @input_filename: (string) Path of the input file.
+
+        @return: (dict) Dict mapping each image ID to the ID of the image
+            searched for in its place.
+    '''
 
-        if html is None:
-            break
+    if not args.img:
+        return {}
 
-    return sources
+    image_ids = (img_data['imageID'] for _, img_data
+                 in json_stream.iter_records(input_filename)
+                 if img_data['shareNumber'] >= args.s)
+
+    return find_duplicates(image_ids, args.img, args.dist)
 
 
 def main():
     log = open(LOG_NAME, 'w')
 
+    if args.c:
+        gc.set_cache(HTTPCache(args.c))
+
+    if args.v:
+        gc.set_verdict_store(VerdictStore(args.v))
+
+    if args.m:
+        metrics.start_writer(args.m)
+
+    if args.mp is not None:
+        metrics.start_server(args.mp)
+
+    index = ImageIndex(args.i) if args.i else None
+    gc.set_pagination(args.n, args.fc)
+
+    egress = [spec for spec in args.e.split(',') if spec]
+
+    if egress:
+        gc.set_egress_pool(EgressPool(egress, gc.client.headers, args.r))
+
     today_filename = get_today_filename()
     input_filename = ROOT_FOLDER + today_filename
+    output_name = OUTPUT_FOLDER + today_filename
 
-    with open(input_filename, 'r') as input_file:  # Input file
-        imgs_data = load(input_file)
-        links = gc.generate_links(imgs_data)
+    if args.j:
+        output_name = output_name[:output_name.rfind('.')] + '.jsonl'
 
-        for img_id in links:
-            img_name = imgs_data[img_id]['imageID']
-            log.write('[+] Image {}\n'.format(img_name))
-            log.flush()
+    def get_job_args(img_data, previous):
+        return gc.generate_link(img_data), log, previous
 
-            if imgs_data[img_id]['shareNumber'] >= args.s:
-                sources = get_sources(links[img_id], log)
-                fact_checked = gc.is_fact_checked(sources)
-                imgs_data[img_id]['sources'] = sources
-                imgs_data[img_id]['fact_checked'] = fact_checked
+    def log_image(line):
+        log.write(line + '\n')
+        log.flush()
 
-                if fact_checked:
-                    imgs_data[img_id]['fact_check'] = gc.get_fact_check(
-                        sources, args.min, args.max)
+    deferred = scheduler.crawl_file(
+        input_filename, output_name, get_duplicates(input_filename),
+        crawl_image, get_job_args, args.w, args.r, args.s, index, args.f,
+        log_image)
+
+    if deferred:
+        log.write('[-] {} images left for a later run.\n'.format(deferred))
 
     log.close()
-    output_name = OUTPUT_FOLDER + today_filename
 
-    with open(output_name, 'w') as output:
-        dump({int(x): imgs_data[x] for x in imgs_data.keys()},
-             output, indent=4, sort_keys=True)
+    if index is not None:
+        index.close()
 
 
 main()
@@ -10,11 +10,17 @@ Search by image.
 
 
 from bs4 import BeautifulSoup
-import urllib.request
+from http_client import HTTPClient
 
 
 DOMAIN = 'www.google.com'
 
+USER_AGENT = '''Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTM
+        L, like Gecko) Chrome/ 58.0.3029.81 Safari/537.36'''
+
+client = HTTPClient([('User-Agent', USER_AGENT),
+                     ("Accept-Language", "en-US,en;q=0.5"), ])
+
 
 def process_url(url):
     '''
@@ -41,14 +47,7 @@ def get_html(url):
     '''
 
     url = process_url(url)
-    user_agent = '''Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTM
-        L, like Gecko) Chrome/ 58.0.3029.81 Safari/537.36'''
-    headers = [('User-Agent', user_agent),
-               ("Accept-Language", "en-US,en;q=0.5"), ]
-    opener = urllib.request.build_opener()
-    opener.addheaders = headers
-
-    html = opener.open(url).read().decode()
+    html = client.get(url).get_text()
     return html
 
 
@@ -10,14 +10,25 @@ files describing a set of images.
 
 
 from bs4 import BeautifulSoup
-from cgi import parse_header
-from contextlib import closing
-from datetime import date, timedelta
-from time import sleep
-from random import uniform
-from zlib import decompress, MAX_WBITS
-
-import urllib.request
+from checker_matcher import CheckerMatcher
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from date_parser import parse_date
+from http_client import HTTPClient
+from metrics import METRICS
+from rate_limiter import RateLimiter
+from retry import BlockedError, CircuitBreaker, FetchError, RetryPolicy
+from url_utils import parse_url
+from urllib.error import HTTPError
+
+import retry
+
+try:
+    import lxml.html
+    PARSER = 'lxml'
+except ImportError:  # Fall back to the slower built-in parser.
+    lxml = None
+    PARSER = 'html.parser'
 
 FACT_CHECKERS = ['boatos.org', 'e-farsas.com', 'g1.globo.com/e-ou-nao-e',
                  'piaui.folha.uol.com.br/lupa', 'g1.globo.com/fato-ou-fake',
@@ -25,24 +36,58 @@ FACT_CHECKERS = ['boatos.org', 'e-farsas.com', 'g1.globo.com/e-ou-nao-e',
                  'veja.abril.com.br/blog/me-engana-que-eu-posto',
                  'aosfatos.org']
 
+# Matcher of links to the fact checkers above.
+MATCHER = CheckerMatcher(FACT_CHECKERS)
+
 FACT_CHECK_HISTORY = {}
 
+# Rate limiter shared by all fetches. Google gets the sleep_min to sleep_max
+# seconds budget given by the caller, other hosts get the default one.
+LIMITER = RateLimiter()
+
+# On-disk response cache shared by all fetches, if any.
+CACHE = None
+
+# Persistent fact checker judgments store, if any.
+VERDICTS = None
+
+# Retry policy of failed requests, and circuit breaker parking the hosts that
+# keep failing.
+RETRY = RetryPolicy()
+BREAKER = CircuitBreaker()
+
+# Pool of egress points requests are sent through, if any. Threads outside of
+# an egress session use the client and rate limiter of this module.
+EGRESS = None
+
+# Pagination policy: stop going through result pages once the fraction of
+# new registrable domains of a page falls below NOVELTY (a page without new
+# domains always stops it), or once a fact checker link is found if
+# STOP_AT_FACT_CHECK. None and False go through all pages.
+NOVELTY = None
+STOP_AT_FACT_CHECK = False
+
 TIME_PARAM = '%2Ccdr%3A1%2Ccd_min%3A1%2F1%2F0%2Ccd_max%3A&tbm='
 URL = 'http://images.google.com.br/searchbyimage?image_url=' + \
       'http://www.monitor-de-whatsapp.dcc.ufmg.br/data/images/{}'
 
 DOMAIN = 'www.google.com.br'
+GOOGLE_DOMAIN = 'google.com.br'
 
-USER_AGENT = '''Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/69.0.3497.81 Safari/537.36'''
+# Marker of the section of the result pages listing the pages that include
+# the image. Everything before it is discarded, on pages that have it.
+MATCHING_PAGES = 'Páginas que incluem imagens correspondentes'
 
-MONTHS = {y: (x + 1) for (x, y) in enumerate(['jan', 'fev', 'mar',
-                                              'abr', 'mai', 'jun',
-                                              'jul', 'ago', 'set',
-                                              'out', 'nov', 'dez'])}
+# Markers of the pages Google serves instead of results when it takes the
+# crawler for a bot: its CAPTCHA form, and the text of its unusual traffic
+# notice. Result snippets may quote the text, so it only counts on pages
+# without a matching pages section.
+BLOCK_FORMS = ['id="captcha-form"', "id='captcha-form'"]
+BLOCK_MARKERS = ['detectaram tráfego incomum', 'detected unusual traffic']
 
-headers = [('User-Agent', USER_AGENT)]
-opener = urllib.request.build_opener()
-opener.addheaders = headers
+USER_AGENT = '''Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/69.0.3497.81 Safari/537.36'''
+
+client = HTTPClient([('User-Agent', USER_AGENT)])
 
 
 def process_url(url):
@@ -60,131 +105,388 @@ def process_url(url):
     return url
 
 
-def get_html(url, sleep_min, sleep_max, redirect=False):
+def is_blocked(url, html=''):
+    '''
+        Check if a response from Google is a block page, i.e., a CAPTCHA or
+        unusual traffic interstitial, instead of the requested page.
+
+        @url: (string) Final URL of the response, after redirects.
+        @html: (string) HTML string of the response, if any.
+
+        @return: (bool) True iff the response is a block page.
+    '''
+
+    parsed_url = parse_url(url)
+
+    if parsed_url.domain != GOOGLE_DOMAIN:
+        return False
+
+    # Google redirects blocked requests to /sorry/index.
+    if parsed_url.path[:1] == ('sorry',):
+        return True
+
+    if any(form in html for form in BLOCK_FORMS):
+        return True
+
+    return MATCHING_PAGES not in html and \
+        any(marker in html for marker in BLOCK_MARKERS)
+
+
+def get_matching_pages(html):
+    '''
+        Get the section of the first result page of an image listing the
+        pages that include it.
+
+        @html: (string) HTML of the first result page.
+
+        @return: (string) HTML of the section, empty if there's none, i.e.,
+            the image wasn't found on any page.
+    '''
+
+    start = html.find(MATCHING_PAGES)
+    return html[start:] if start >= 0 else ''
+
+
+def get_html(url, sleep_min, sleep_max, redirect=False, scan=False):
     '''
         Get the HTML string corresponding to a particular URL.
 
         @url: (string) URL.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
         @redirect: (bool) Indicates whether the param url will be redirected.
+        @scan: (bool) Only keep the part of a result page from its matching
+            pages section on, discarding the rest while it's downloaded.
+            Pages without the section are kept whole.
 
         @return: (string) HTML string.
+
+        @raise: (FetchError) If the request failed for good, BlockedError if
+            Google answered it with a block page. Blocks slow down all
+            requests, and requests to Google that aren't blocked speed them
+            up again.
     '''
 
     url = process_url(url)
+    domain = parse_url(url).domain
+
+    if CACHE is not None:
+        html = CACHE.get(url)
+
+        if html is not None:
+            METRICS.add('cache_hits', domain)
+            return html
+
+    requested_url = url
+    egress = get_egress()
+    http = client if egress is None else egress.client
+
+    def fetch(url, start=None):
+        '''
+            Wait for the turn of a URL and request it.
+        '''
+
+        wait_turn(url, sleep_min, sleep_max)
 
-    if redirect:
-        while True:
-            try:
-                with closing(opener.open(url)) as open_url:
-                    redirect_url = open_url.url
-                    new_url = ''.join(redirect_url.split('&')
-                                      [:-1]) + TIME_PARAM
-                    url = process_url(new_url)
-                    slow_down(sleep_min, sleep_max)
-                    break
-            except:
-                print('\t\t[-] Exception occurred, retrying.')
-                slow_down(sleep_min, sleep_max)
-                continue
-
-    while True:
         try:
-            with closing(opener.open(url)) as open_url:
-                data = open_url.read()
-                html = data.decode()
-                slow_down(sleep_min, sleep_max)
-                break
-        except UnicodeDecodeError:
-            with closing(opener.open(url)) as open_url:
-                content_type = open_url.getheader('Content-Type')
-                content_encoding = open_url.getheader('Content-Encoding')
-                data = open_url.read()
-
-                # Try to decompress content.
-                if content_encoding is not None and 'gzip' in content_encoding:
-                    html = decompress(data, 16 + MAX_WBITS)
-                    slow_down(sleep_min, sleep_max)
-                    break
-
-                # Try to guess encoding.
-                if content_type is not None and 'charset' in content_type:
-                    charset = content_type.split('charset=')[1]
-                    html = data.decode(charset)
-                    slow_down(sleep_min, sleep_max)
-                    break
-
-            return ''
-        except:
-            print('\t\t[-] Exception occurred, retrying.')
-            slow_down(sleep_min, sleep_max)
-            continue
+            response = http.get(url, start=start)
+        except OSError as error:
+            if isinstance(error, HTTPError) and (
+                    is_blocked(error.url) or (error.code == 429 and
+                                              parse_url(url).domain ==
+                                              GOOGLE_DOMAIN)):
+                block(error.url)
+
+            record(url, False)
+            raise
+
+        if is_blocked(response.url):
+            block(response.url)
+
+        return response
+
+    def call(url, start=None):
+        '''
+            Request a URL, retrying it on transient errors. Each egress has
+            circuits of its own.
+        '''
+
+        key = parse_url(url).domain
+
+        if egress is not None:
+            key = '{} via {}'.format(key, egress.name)
+
+        return retry.call(lambda: fetch(url, start), key, RETRY, BREAKER)
+
+    start = MATCHING_PAGES.encode() if scan else None
+
+    # Only the final URL of the redirect step matters.
+    if redirect:
+        redirect_url = call(url, start).url
+        new_url = ''.join(redirect_url.split('&')[:-1]) + TIME_PARAM
+        url = process_url(new_url)
+
+    response = call(url, start)
+
+    with METRICS.timer('decode', domain):
+        html = response.get_text()
+
+    if is_blocked(url, html):
+        block(url)
+
+    if parse_url(url).domain == GOOGLE_DOMAIN:
+        get_limiter().on_success()
+        record(url, True)
+
+    if CACHE is not None:
+        CACHE.put(requested_url, html)
 
     return html
 
 
-def parse_date(raw_date):
+def block(url):
     '''
-        Parse a raw date string and return a formatted date string.
+        Slow down all requests after Google blocked one.
 
-        @raw_date: (string) Raw date string.
+        @url: (string) URL of the block page.
 
-        @return: (string) Formatted date string.
+        @raise: (BlockedError) Always.
     '''
 
-    pieces = raw_date.split()
+    METRICS.add('blocks', GOOGLE_DOMAIN)
+    scale = get_limiter().on_block()
+    egress = get_egress()
 
-    if len(pieces) == 5:  # x de x de x
-        year = int(pieces[4])
-        month = MONTHS[pieces[2]]
-        day = int(pieces[0])
+    if egress is not None:
+        EGRESS.record(egress, False, True)
 
-        return date(year, month, day).isoformat()
-    elif len(pieces) == 3:  # x x atrás
-        offset = int(pieces[0])
-        return (date.today() - timedelta(days=offset)).isoformat()
-    else:  # unknown
-        return ''
+    print('\t\t[-] Blocked by Google, requests slowed down {:g}x.'.format(
+        scale))
+    raise BlockedError(GOOGLE_DOMAIN, url)
 
 
-def get_page_sources(html):
+def record(url, healthy):
     '''
-        Get image sources on a particular page.
+        Record the outcome of a request to Google in the health score of the
+        egress it went through, if any.
+
+        @url: (string) Requested URL.
+        @healthy: (bool) Whether the request succeeded.
+    '''
+
+    egress = get_egress()
+
+    if egress is not None and parse_url(url).domain == GOOGLE_DOMAIN:
+        EGRESS.record(egress, healthy)
+
+
+def has_class(name):
+    '''
+        Build an XPath predicate matching elements with a particular class.
+
+        @name: (string) Class name.
+
+        @return: (string) XPath predicate.
+    '''
+
+    return "contains(concat(' ', normalize-space(@class), ' '), ' {} ')" \
+        .format(name)
+
+
+# Result links, result snippets, result boxes, forum dates and the next page
+# link, in document order.
+RESULT_XPATH = ("//a[@id='pnnext' and {pn}] | //h3[{r}] | //span[{st}] | "
+                "//div[{r} or {rc} or @class='slp f']").format(
+                    pn=has_class('pn'), r=has_class('r'), st=has_class('st'),
+                    rc=has_class('rc'))
+
+
+def get_string(element):
+    '''
+        Get the text of an lxml element the way BeautifulSoup's Tag.string
+        does: only if the element holds a single string, directly or through
+        a single child.
+
+        @element: (HtmlElement) HTML element.
+
+        @return: (string) Element string, or None.
+    '''
+
+    children = list(element)
+
+    if not children:
+        return element.text
+
+    if len(children) == 1 and not element.text and not children[0].tail:
+        return get_string(children[0])
+
+    return None
+
+
+def iter_result_tags_lxml(html):
+    '''
+        Go through the tags of a search result page with lxml.
 
         @html: (string) Page HTML content.
 
-        @return: (string list) List of sources of the image on the page.
+        @return: ((string, object, object) generator) Kind of each tag
+            ('next', 'date', 'box', 'link' or 'forum'), its value and, for
+            boxes and forum dates, the key of the boxes involved.
+    '''
+
+    try:
+        root = lxml.html.document_fromstring(html)
+    except lxml.etree.ParserError:  # Empty document.
+        return
+
+    for element in root.xpath(RESULT_XPATH):
+        classes = (element.get('class') or '').split()
+
+        if element.tag == 'a':
+            yield 'next', element.get('href'), None
+        elif element.tag == 'span':
+            span = element.find('.//span')
+            yield 'date', get_string(span) if span is not None else None, \
+                None
+        elif 'rc' in classes:
+            yield 'box', None, element
+        elif 'r' in classes:
+            yield 'link', element.find('.//a').get('href'), None
+        else:
+            yield 'forum', get_string(element), set(element.iterancestors())
+
+
+def is_result_tag(tag):
+    '''
+        Check if a tag holds information extracted from search result pages.
+
+        @tag: (Tag) HTML tag.
+
+        @return: (bool) True iff the tag is a result link, a result snippet,
+            a result box, a forum date or the next page link.
+    '''
+
+    classes = tag.get('class') or []
+
+    if tag.name == 'a':
+        return 'pn' in classes and tag.get('id') == 'pnnext'
+    elif tag.name == 'h3':
+        return 'r' in classes
+    elif tag.name == 'span':
+        return 'st' in classes
+    elif tag.name == 'div':
+        return 'r' in classes or 'rc' in classes or \
+            ' '.join(classes) == 'slp f'
+
+    return False
+
+
+def iter_result_tags_soup(html):
+    '''
+        Go through the tags of a search result page with BeautifulSoup.
+
+        @html: (string) Page HTML content.
+
+        @return: ((string, object, object) generator) Kind of each tag
+            ('next', 'date', 'box', 'link' or 'forum'), its value and, for
+            boxes and forum dates, the key of the boxes involved.
+    '''
+
+    soup = BeautifulSoup(html, PARSER)
+
+    for tag in soup.find_all(is_result_tag):
+        classes = tag.get('class')
+
+        if tag.name == 'a':
+            yield 'next', tag.get('href'), None
+        elif tag.name == 'span':
+            yield 'date', tag.span.string if tag.span is not None else None, \
+                None
+        elif 'rc' in classes:
+            yield 'box', None, id(tag)
+        elif 'r' in classes:
+            yield 'link', tag.a.get('href'), None
+        else:
+            yield 'forum', tag.string, set(id(p) for p in tag.parents)
+
+
+def parse_result_page(html):
     '''
+        Parse a search result page, going through its tags only once.
 
-    soup = BeautifulSoup(html, 'html.parser')
+        @html: (string) Page HTML content.
 
-    links = [link.a.get('href')
-             for link in soup.find_all(['div', 'h3'], {'class': 'r'})]
+        @return: (((string, string) list, string) tuple) List of sources of
+            the image on the page, and link to the next page (None if it's
+            the last page).
+    '''
 
-    dates = [parse_date(date.span.string.split(' - ')[1])
-             if date.span is not None and date.span.string is not None else ''
-             for date in soup.find_all('span', {'class': 'st'})]
+    with METRICS.timer('parse', GOOGLE_DOMAIN):
+        return parse_tags(iter_result_tags_lxml(html) if lxml is not None
+                          else iter_result_tags_soup(html))
 
-    if len(links) != len(dates) - dates.count(''):
-        forum_dates = soup.find_all('div', {'class': 'slp f'})
 
-        if len(forum_dates) > 0:
-            forum_dates = [parse_date(date.string.split(' - ')[0])
-                           if date is not None and date.string is not None else ''
-                           for date in forum_dates]
+def parse_tags(tags):
+    '''
+        Extract the sources and the next page link from the tags of a search
+        result page.
+
+        @tags: ((string, object, object) iterable) Tags, as yielded by
+            iter_result_tags_lxml or iter_result_tags_soup.
+
+        @return: (((string, string) list, string) tuple) List of sources of
+            the image on the page, and link to the next page (None if it's
+            the last page).
+    '''
 
-            boxes = soup.find_all('div', {'class': 'rc'})
-            indexes = [True if b.find_all('div', {'class': 'slp f'}) else False
-                       for b in boxes]
+    links = []
+    dates = []
+    boxes = []
+    forum_dates = []
+    next_page_link = None
+
+    for kind, value, key in tags:
+        if kind == 'next':
+            if next_page_link is None:
+                next_page_link = value
+        elif kind == 'date':
+            dates.append(parse_date(value.split(' - ')[1])
+                         if value is not None else '')
+        elif kind == 'box':
+            boxes.append(key)
+        elif kind == 'link':
+            links.append(value)
+        else:
+            forum_dates.append((parse_date(value.split(' - ')[0])
+                                if value is not None else '', key))
+
+    if len(links) != len(dates) - dates.count('') and len(forum_dates) > 0:
+        # Result boxes that contain a forum date.
+        forum_boxes = set()
+        for _, ancestors in forum_dates:
+            forum_boxes.update(ancestors)
+
+        index = 0
+        for i, b in enumerate(boxes):
+            if b in forum_boxes and dates[i] == '':
+                dates[i] = forum_dates[index][0]
+                index += 1
+
+    return list(zip(links, dates)), next_page_link
 
-            index = 0
-            for i, b in enumerate(indexes):
-                if b and dates[i] == '':
-                    dates[i] = forum_dates[index]
-                    index += 1
 
-    return list(zip(links, dates))
+def get_page_sources(html):
+    '''
+        Get image sources on a particular page.
+
+        @html: (string) Page HTML content.
+
+        @return: (string list) List of sources of the image on the page.
+    '''
+
+    return parse_result_page(html)[0]
 
 
 def get_next_page(html, sleep_min, sleep_max):
@@ -192,70 +494,323 @@ def get_next_page(html, sleep_min, sleep_max):
         Get the HTML content for the next search result page.
 
         @html: (string) HTML content of current page.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (string) HTML content of next page.
     '''
 
-    soup = BeautifulSoup(html, 'html.parser')
-    next_page = soup.find_all('a', {'class': 'pn', 'id': 'pnnext'})
+    next_page_link = parse_result_page(html)[1]
 
-    if len(next_page) == 0:
+    if next_page_link is None:
         return None
 
-    next_page_link = DOMAIN + next_page[0].get('href')
-    return get_html(next_page_link, sleep_min, sleep_max)
+    return get_html(DOMAIN + next_page_link, sleep_min, sleep_max,
+                    scan=True)
+
+
+def set_limiter(limiter):
+    '''
+        Set the rate limiter shared by all fetches.
+
+        @limiter: (RateLimiter) Rate limiter.
+
+        @return: (RateLimiter) Previous rate limiter.
+    '''
+
+    global LIMITER
+    previous = LIMITER
+    LIMITER = limiter
+
+    return previous
+
+
+def set_egress_pool(pool):
+    '''
+        Set the pool of egress points requests are sent through.
+
+        @pool: (EgressPool) Egress pool, or None to send all requests through
+            the client of this module.
+    '''
+
+    global EGRESS
+    EGRESS = pool
+
 
+def get_egress():
+    '''
+        Get the egress the current thread sends its requests through.
+
+        @return: (Egress) Egress, None if there's no egress session.
+    '''
+
+    return EGRESS.current() if EGRESS is not None else None
+
+
+def get_limiter():
+    '''
+        Get the rate limiter of the requests of the current thread.
+
+        @return: (RateLimiter) Rate limiter of the egress of the thread, or
+            the one shared by all fetches.
+    '''
+
+    egress = get_egress()
+    return LIMITER if egress is None else egress.limiter
+
+
+@contextmanager
+def egress_session(egress=None):
+    '''
+        Send the requests of the current thread through a single egress of
+        the pool until the block ends, e.g., while going through the result
+        pages of an image. Does nothing without a pool, or if the thread
+        already has an egress.
+
+        @egress: (Egress) Egress acquired by the caller. None acquires one
+            for the block.
+    '''
+
+    if egress is not None:
+        with EGRESS.bind(egress):
+            yield egress
+        return
+
+    if EGRESS is None or EGRESS.current() is not None:
+        yield get_egress()
+        return
 
-def slow_down(sleep_min, sleep_max):
+    with EGRESS.session() as egress:
+        yield egress
+
+
+def set_cache(cache):
     '''
-        Sleeps for awhile after each request, so the crawler looks slightly
-        more human.
+        Set the on-disk response cache shared by all fetches.
 
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @cache: (HTTPCache) Response cache, or None to disable caching.
     '''
 
-    sleep(uniform(sleep_min, sleep_max))
+    global CACHE
+    CACHE = cache
 
 
-def get_sources(url, sleep_min, sleep_max, pages):
+def set_verdict_store(store):
+    '''
+        Set the persistent store of fact checker judgments.
+
+        @store: (VerdictStore) Judgments store, or None to disable it.
+    '''
+
+    global VERDICTS
+    VERDICTS = store
+
+
+def set_retry_policy(policy, breaker):
+    '''
+        Set how failed requests are retried.
+
+        @policy: (RetryPolicy) Retry policy.
+        @breaker: (CircuitBreaker) Circuit breaker, or None to never park
+            hosts.
+    '''
+
+    global RETRY, BREAKER
+    RETRY = policy
+    BREAKER = breaker
+
+
+def set_pagination(novelty=None, stop_at_fact_check=False):
+    '''
+        Set the pagination policy.
+
+        @novelty: (float) Minimum fraction of new registrable domains among
+            the sources of a result page for the next page to be fetched.
+            None disables the novelty check.
+        @stop_at_fact_check: (bool) Stop at the first result page with a fact
+            checker link, e.g., when only fact checked images matter.
+    '''
+
+    global NOVELTY, STOP_AT_FACT_CHECK
+    NOVELTY = novelty
+    STOP_AT_FACT_CHECK = stop_at_fact_check
+
+
+def get_stop_reason(page_sources, seen_domains, known=None):
+    '''
+        Check if the pagination policy stops going through the result pages
+        of an image after one of them.
+
+        @page_sources: ((string, string) list) Sources of the result page.
+        @seen_domains: (string set) Registrable domains of the sources of
+            the previous result pages. Updated with the ones of this page.
+        @known: (string set) Source links collected by a previous crawl of the
+            image. If given, stop at the first result page without new
+            sources.
+
+        @return: (string) Policy that stops the pagination ('refresh',
+            'fact_check' or 'novelty'), or None if the next page should be
+            fetched.
+    '''
+
+    if known is not None and all(s[0] in known for s in page_sources):
+        return 'refresh'
+
+    domains = set(parse_url(s[0]).domain for s in page_sources)
+    new_domains = domains - seen_domains
+    seen_domains.update(new_domains)
+
+    if STOP_AT_FACT_CHECK and is_fact_checked(page_sources):
+        return 'fact_check'
+
+    if NOVELTY is not None and (not new_domains or
+                                len(new_domains) < NOVELTY * len(domains)):
+        return 'novelty'
+
+    return None
+
+
+def paginate(html, page, pages, seen_domains, known=None):
+    '''
+        Go through a result page of an image, and check if the next one
+        should be fetched.
+
+        @html: (string) HTML of the result page.
+        @page: (int) Number of the result page, starting at 1.
+        @pages: (int) Number of search result pages to go through.
+        @seen_domains: (string set) Registrable domains of the sources of
+            the previous result pages. Updated with the ones of this page.
+        @known: (string set) Source links collected by a previous crawl of the
+            image, if any.
+
+        @return: ((string, string) list, string, string) Sources of the
+            page, link to the next page (None if the pagination ends here)
+            and the policy that stopped the pagination, if any.
+    '''
+
+    page_sources, next_page_link = parse_result_page(html)
+
+    # The page after the last one to go through is never parsed.
+    if next_page_link is None or page + 1 >= pages:
+        return page_sources, None, None
+
+    reason = get_stop_reason(page_sources, seen_domains, known)
+
+    if reason is not None:
+        next_page_link = None
+
+    return page_sources, next_page_link, reason
+
+
+def get_pagination_stats(pages, parsed, reason):
+    '''
+        Get the pagination stats of an image.
+
+        @pages: (int) Number of search result pages to go through.
+        @parsed: (int) Number of result pages gone through.
+        @reason: (string) Policy that stopped the pagination, if any.
+
+        @return: (dict) Number of result pages gone through, the policy that
+            stopped the pagination and the number of pages it saved.
+    '''
+
+    saved = max(pages - 1 - parsed, 0) if reason is not None else 0
+    return {'pages': parsed, 'stopped_by': reason, 'saved': saved}
+
+
+def wait_turn(url, sleep_min, sleep_max):
+    '''
+        Wait until the rate limiter allows a request to a URL.
+
+        @url: (string) URL about to be requested.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
+
+        @return: (float) Number of seconds waited.
+    '''
+
+    limiter = get_limiter()
+    limiter.set_interval(GOOGLE_DOMAIN, sleep_min, sleep_max)
+
+    return limiter.wait(url)
+
+
+def get_sources(url, sleep_min, sleep_max, pages, stats=None, known=None,
+                log=None):
     '''
         Get all source links where the image has appeared on.
 
         @url: (string) HTML of the first result page for the image.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
         @pages: (int) Number of search result pages to go through.
+        @stats: (dict) If given, updated with the pagination stats of the
+            image.
+        @known: (string set) Source links collected by a previous crawl of the
+            image. If given, stop at the first result page without new
+            sources.
+        @log: (function) Called with the number of each result page. None
+            prints it.
 
         @return: ((string, string) list) List of all the source links where
             the image has appeared on.
     '''
 
-    html = get_html(url, sleep_min, sleep_max, True)
+    html = get_html(url, sleep_min, sleep_max, True, True)
     sources = []
+    seen_domains = set()
+    parsed = 0
+    reason = None
 
     # Only look for links where the image has appeared on.
-    html = html[html.find('Páginas que incluem imagens correspondentes'):]
+    html = get_matching_pages(html)
 
     page = 1
     while True:  # Look for other sources in the rest of the result pages.
-        print('\t\t[+] Search result page {}'.format(page))
-        page += 1
+        if log is None:
+            print('\t\t[+] Search result page {}'.format(page))
+        else:
+            log(page)
 
-        if page > pages:
+        if page >= pages:
             break
 
-        sources += get_page_sources(html)
-        html = get_next_page(html, sleep_min, sleep_max)
+        page_sources, next_page_link, reason = paginate(
+            html, page, pages, seen_domains, known)
+        sources += page_sources
+        parsed += 1
+        page += 1
 
-        if html is None:
+        if next_page_link is None:
             break
 
+        html = get_html(DOMAIN + next_page_link, sleep_min, sleep_max,
+                        scan=True)
+
+    if stats is not None:
+        stats.update(get_pagination_stats(pages, parsed, reason))
+
     return sources
 
 
+def generate_link(img_data):
+    '''
+        Generate the Google Search by Image link of an image.
+
+        @img_data: (dict) JSON dict with the image data.
+
+        @return: (string) Google Search by Image link.
+    '''
+
+    return URL.format(img_data['imageID'])
+
+
 def generate_links(imgs_data):
     '''
         Generate Google Search by Image links.
@@ -268,7 +823,7 @@ def generate_links(imgs_data):
     links = {}
 
     for img_n in imgs_data:
-        links[img_n] = URL.format(imgs_data[img_n]['imageID'])
+        links[img_n] = generate_link(imgs_data[img_n])
 
     return links
 
@@ -283,8 +838,7 @@ def is_fact_checked(sources):
         @return: (bool) True, iff, the image was fact checked.
     '''
 
-    links = set([s[0] for s in sources])
-    return any(f in l for f in FACT_CHECKERS for l in links)
+    return any(MATCHER.match(s[0]) is not None for s in sources)
 
 
 def check_boatos(link, sleep_min, sleep_max):
@@ -292,23 +846,22 @@ def check_boatos(link, sleep_min, sleep_max):
         Check boatos.org judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) >= 2:
-            if split[1] == '' or split[1] == 'wp-content':
-                return None
+    url = parse_url(link)
+    if len(url.path) >= 1:
+        if url.path[0] == '' or url.path[0] == 'wp-content':
+            return None
 
-            if 'boatos.org' not in split[0]:
-                return None
+        if 'boatos.org' not in url.host:
+            return None
 
     # In case it's not root
     html = get_html(link, sleep_min, sleep_max)
@@ -324,26 +877,25 @@ def check_efarsas(link, sleep_min, sleep_max):
         Check e-farsas judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root or blog.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) >= 2:
-            if split[1] == '' or split[1] == 'blog':
-                return None
+    url = parse_url(link)
+    if len(url.path) >= 1:
+        if url.path[0] == '' or url.path[0] == 'blog':
+            return None
 
     if 'e-farsas.com/secoes' in link:
         return None
 
     html = get_html(link, sleep_min, sleep_max)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, PARSER)
     title = soup.find_all('span', {'class': 'mvp-post-cat left'})
 
     if len(title) > 0:
@@ -360,22 +912,20 @@ def check_e_ou_nao_e(link, sleep_min, sleep_max):
         Check G1 É ou não É judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) <= 2:
-            return None
+    if len(parse_url(link).path) <= 1:
+        return None
 
     html = get_html(link, sleep_min, sleep_max)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, PARSER)
     title = soup.find_all('h1', {'class': 'content-head__title'})
 
     if len(title) > 0:
@@ -390,22 +940,20 @@ def check_lupa(link, sleep_min, sleep_max):
         Check Lupa judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) <= 2:
-            return None
+    if len(parse_url(link).path) <= 1:
+        return None
 
     html = get_html(link, sleep_min, sleep_max)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, PARSER)
     post = soup.find_all('div', {'class': 'post-inner'})
 
     if len(post) > 0:
@@ -424,24 +972,22 @@ def check_fato_ou_fake(link, sleep_min, sleep_max):
         Check G1 Fato ou Fake judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) <= 2:
-            return None
+    if len(parse_url(link).path) <= 1:
+        return None
 
     html = get_html(link, sleep_min, sleep_max)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, PARSER)
 
-    if 'oglobo.globo.com' in link:  # O Globo
+    if 'oglobo.globo.com' in parse_url(link).host:  # O Globo
         title = soup.find_all('h1', {'class': 'article__title'})
     else:  # G1
         title = soup.find_all('h1', {'class': 'content-head__title'})
@@ -464,23 +1010,22 @@ def check_aos_fatos(link, sleep_min, sleep_max):
         Check Aos Fatos judgment about a content.
 
         @link: (string) Link to content.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (bool) True iff the content was considered true.
     '''
 
     # Check if link is root or blog.
-    split = link.split('//')
-    if len(split) >= 2:
-        split = split[1].split('/')
-
-        if len(split) >= 2:
-            if split[1] == '':
-                return None
+    url = parse_url(link)
+    if len(url.path) >= 1:
+        if url.path[0] == '':
+            return None
 
     html = get_html(link, sleep_min, sleep_max)
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, PARSER)
     tags = [cap.string.lower()
             if cap.string is not None else None
             for cap in soup.find_all('figcaption')]
@@ -488,42 +1033,140 @@ def check_aos_fatos(link, sleep_min, sleep_max):
     return tags.count('verdadeiro') > tags.count('falso')
 
 
+CHECK_FUNCTIONS = {
+    'boatos.org': check_boatos,
+    'e-farsas.com': check_efarsas,
+    'g1.globo.com/e-ou-nao-e': check_e_ou_nao_e,
+    'piaui.folha.uol.com.br/lupa': check_lupa,
+    'g1.globo.com/fato-ou-fake': check_fato_ou_fake,
+    'oglobo.globo.com/fato-ou-fake': check_fato_ou_fake,
+    'aosfatos.org': check_aos_fatos
+}
+
+# Version of each fact checker parser. Bump it when a check_* function
+# changes, so judgments stored by the previous version are ignored.
+CHECKER_VERSIONS = {
+    'boatos.org': 1,
+    'e-farsas.com': 1,
+    'g1.globo.com/e-ou-nao-e': 1,
+    'piaui.folha.uol.com.br/lupa': 1,
+    'g1.globo.com/fato-ou-fake': 1,
+    'oglobo.globo.com/fato-ou-fake': 1,
+    'aosfatos.org': 1
+}
+
+# Number of fact checking articles fetched at the same time. Requests to the
+# same host are still paced by the rate limiter.
+FACT_CHECK_WORKERS = 8
+
+
+def check_sources(checker, links, sleep_min, sleep_max):
+    '''
+        Get the judgment of a fact checker, going through the links to its
+        articles until one of them has a judgment.
+
+        @checker: (string) Fact checker, a key of CHECK_FUNCTIONS.
+        @links: (string list) Links to the fact checker articles, in the
+            order they appeared on the search results.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
+
+        @return: (bool) Fact check judgment, or None if there's none.
+    '''
+
+    judgment = None
+    version = CHECKER_VERSIONS[checker]
+
+    for link in links:
+        if link not in FACT_CHECK_HISTORY:
+            stored = VERDICTS.get(link, checker, version) \
+                if VERDICTS is not None else None
+
+            if stored is not None:
+                FACT_CHECK_HISTORY[link] = stored['verdict']
+            else:
+                try:
+                    with METRICS.timer('fact_check', parse_url(link).domain):
+                        verdict = CHECK_FUNCTIONS[checker](link, sleep_min,
+                                                           sleep_max)
+                except FetchError as error:
+                    # Try the next article. Articles that can't be fetched for
+                    # now are tried again by later runs.
+                    print('\t\t[-] {}'.format(error))
+
+                    if error.kind == retry.PERMANENT:
+                        FACT_CHECK_HISTORY[link] = None
+
+                    continue
+
+                FACT_CHECK_HISTORY[link] = verdict
+
+                if VERDICTS is not None:
+                    VERDICTS.put(link, checker, version,
+                                 FACT_CHECK_HISTORY[link])
+
+        judgment = FACT_CHECK_HISTORY[link]
+
+        if judgment is not None:
+            break
+
+    return judgment
+
+
+def get_fact_checks(sources_list, sleep_min, sleep_max):
+    '''
+        Check if a batch of images was fact checked true or false. Articles of
+        different fact checkers, and of different images, are fetched at the
+        same time.
+
+        @sources_list: (((string, string) list) list) List of sources where
+            each image has appeared.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
+
+        @return: (dict list) Dictionary with the fact checkers and their fact
+            check judgment, for each image.
+    '''
+
+    fact_checks = [{} for _ in sources_list]
+
+    with ThreadPoolExecutor(max_workers=FACT_CHECK_WORKERS) as executor:
+        futures = {}
+
+        for i, sources in enumerate(sources_list):
+            checker_links = MATCHER.classify(s[0] for s in sources)
+
+            for f, links in checker_links.items():
+                if f not in CHECK_FUNCTIONS:
+                    continue
+
+                future = executor.submit(check_sources, f, links, sleep_min,
+                                         sleep_max)
+                futures[future] = (i, f)
+
+        for future, (i, f) in futures.items():
+            fact_checks[i][f] = future.result()
+
+    return fact_checks
+
+
 def get_fact_check(sources, sleep_min, sleep_max):
     '''
         Check if a particular image was fact checked true or false.
 
         @sources: ((string, string) list) List of sources where the image has
             appeared.
-        @sleep_min: (float) Minimum amount of seconds to sleep for.
-        @sleep_max: (float) Maximum amount of seconds to sleep for.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
 
         @return: (dict) Dictionary with the fact checkers and their fact check
             judgment.
     '''
 
-    global FACT_CHECK_HISTORY
-
-    fact_checks = {}
-    check_functions = {
-        'boatos.org': check_boatos,
-        'e-farsas.com': check_efarsas,
-        'g1.globo.com/e-ou-nao-e': check_e_ou_nao_e,
-        'piaui.folha.uol.com.br/lupa': check_lupa,
-        'g1.globo.com/fato-ou-fake': check_fato_ou_fake,
-        'oglobo.globo.com/fato-ou-fake': check_fato_ou_fake,
-        'aosfatos.org': check_aos_fatos
-    }
-
-    for source, _ in sources:
-        for f in check_functions:
-            if f in source and fact_checks.get(f, None) is None:
-                if source in FACT_CHECK_HISTORY:
-                    fact_checks[f] = FACT_CHECK_HISTORY[source]
-                else:
-                    fact_checks[f] = check_functions[f](
-                        source, sleep_min, sleep_max)
-                    FACT_CHECK_HISTORY[source] = fact_checks[f]
-
-                continue
-
-    return fact_checks
+    return get_fact_checks([sources], sleep_min, sleep_max)[0]
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Persistent on-disk cache of HTTP responses, keyed by normalized URL.
+'''
+
+
+from hashlib import sha1
+from threading import Lock
+from time import time
+from url_utils import get_host
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from zlib import compress, decompress
+
+import sqlite3
+
+
+DAY = 24 * 60 * 60
+
+# Seconds a cached response stays valid, per domain. Search result pages
+# change faster than fact checking articles.
+DOMAIN_TTLS = {
+    'google.com.br': 7 * DAY,
+    'boatos.org': 90 * DAY,
+    'e-farsas.com': 90 * DAY,
+    'g1.globo.com': 90 * DAY,
+    'oglobo.globo.com': 90 * DAY,
+    'piaui.folha.uol.com.br': 90 * DAY,
+    'veja.abril.com.br': 90 * DAY,
+    'aosfatos.org': 90 * DAY
+}
+DEFAULT_TTL = 30 * DAY
+
+# Maximum size of the cached responses, in bytes.
+DEFAULT_MAX_SIZE = 1024 ** 3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at
+    ON responses (accessed_at);
+'''
+
+
+def normalize_url(url):
+    '''
+        Normalize a URL, so equivalent URLs share the same cache entry.
+
+        @url: (string) URL.
+
+        @return: (string) Normalized URL.
+    '''
+
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path or '/', query, ''))
+
+
+def get_ttl(url):
+    '''
+        Get the number of seconds a response from a URL stays valid.
+
+        @url: (string) URL.
+
+        @return: (float) Time to live, in seconds.
+    '''
+
+    host = get_host(url)
+
+    for domain, ttl in DOMAIN_TTLS.items():
+        if host == domain or host.endswith('.' + domain):
+            return ttl
+
+    return DEFAULT_TTL
+
+
+class HTTPCache:
+    '''
+        SQLite backed response cache, with a time to live per domain and a
+        size cap enforced by evicting the least recently used responses.
+        Safe to share between threads.
+    '''
+
+    def __init__(self, path, max_size=DEFAULT_MAX_SIZE):
+        '''
+            @path: (string) Path of the SQLite database file.
+            @max_size: (int) Maximum size of the cached responses, in bytes.
+        '''
+
+        self.max_size = max_size
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._size = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def get(self, url):
+        '''
+            Get the cached response of a URL.
+
+            @url: (string) URL.
+
+            @return: (string) Cached response, or None if there's no valid
+                cached response.
+        '''
+
+        key = sha1(normalize_url(url).encode()).hexdigest()
+        now = time()
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT body, fetched_at FROM responses WHERE key = ?',
+                (key,)).fetchone()
+
+            if row is None:
+                return None
+
+            if now - row[1] > get_ttl(url):
+                self._delete(key)
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                'UPDATE responses SET accessed_at = ? WHERE key = ?',
+                (now, key))
+            self._db.commit()
+
+        return decompress(row[0]).decode()
+
+    def put(self, url, text):
+        '''
+            Cache the response of a URL.
+
+            @url: (string) URL.
+            @text: (string) Response.
+        '''
+
+        key = sha1(normalize_url(url).encode()).hexdigest()
+        body = compress(text.encode())
+        now = time()
+
+        with self._lock:
+            self._delete(key)
+            self._db.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, url, body, len(body), now, now))
+            self._size += len(body)
+            self._evict()
+            self._db.commit()
+
+    def close(self):
+        '''
+            Close the cache.
+        '''
+
+        with self._lock:
+            self._db.close()
+
+    def _delete(self, key):
+        '''
+            Delete a cached response, if present. Lock must be held.
+
+            @key: (string) Cache key.
+        '''
+
+        row = self._db.execute('SELECT size FROM responses WHERE key = ?',
+                               (key,)).fetchone()
+
+        if row is not None:
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._size -= row[0]
+
+    def _evict(self):
+        '''
+            Evict least recently used responses until the cache fits its size
+            cap. Lock must be held.
+        '''
+
+        if self._size <= self.max_size:
+            return
+
+        rows = self._db.execute(
+            'SELECT key, size FROM responses ORDER BY accessed_at')
+
+        evicted = []
+        for key, size in rows:
+            if self._size <= self.max_size:
+                break
+
+            evicted.append((key,))
+            self._size -= size
+
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
@@ -0,0 +1,675 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+HTTP client shared by the crawling scripts. Keeps a pool of keep-alive
+connections per host and transparently decodes gzip, deflate and, if the
+brotli module is installed, brotli encoded responses, as they are read.
+Response bodies are decoded to text with the charset of their headers or meta
+tags or, if chardet is installed, its guess. Requests can go through an HTTP
+proxy or, if the PySocks module is installed, a SOCKS5 proxy.
+'''
+
+
+from metrics import METRICS
+from threading import Lock
+from time import perf_counter
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+from url_utils import get_registrable_domain
+
+import codecs
+import http.client
+import re
+import socket
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import socks
+except ImportError:
+    socks = None
+
+try:
+    from chardet import detect
+except ImportError:
+    try:  # Same interface.
+        from charset_normalizer import detect
+    except ImportError:
+        detect = None
+
+
+ENCODINGS = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+# Number of bytes response bodies are read at a time.
+CHUNK_SIZE = 1 << 16
+
+# Charset declared by a meta tag, looked for in the first META_WINDOW bytes of
+# a body.
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([\w.:-]+)',
+                          re.IGNORECASE)
+META_WINDOW = 4096
+
+# Minimum confidence of the charset guessed by chardet for it to be used.
+MIN_CONFIDENCE = 0.9
+
+
+class Response:
+    '''
+        HTTP response, with its body already read and decoded.
+    '''
+
+    def __init__(self, url, status, headers, body):
+        '''
+            @url: (string) Final URL, after following redirects.
+            @status: (int) HTTP status code.
+            @headers: (HTTPMessage) Response headers.
+            @body: (bytes) Response body, without content encoding.
+        '''
+
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        '''
+            Get the value of a response header.
+
+            @name: (string) Header name.
+            @default: (string) Value returned if the header isn't present.
+
+            @return: (string) Header value.
+        '''
+
+        return self.headers.get(name, default)
+
+    def get_text(self):
+        '''
+            Get the response body as text.
+
+            @return: (string) Body, decoded as described in decode_text.
+        '''
+
+        return decode_text(self.body, self.headers)
+
+
+def decode_text(body, headers=None):
+    '''
+        Decode a body to text, with the first charset it's valid in among:
+        the one of its byte order mark, the one declared by the Content-Type
+        header, the one declared by a meta tag and UTF-8. Then chardet's
+        guess, if it's installed and confident enough, or UTF-8. Bytes
+        invalid in the chosen charset are replaced, so decoding never fails.
+
+        @body: (bytes) Body, without content encoding.
+        @headers: (HTTPMessage) Response headers, if any.
+
+        @return: (string) Text.
+    '''
+
+    charsets = []
+
+    if body.startswith(codecs.BOM_UTF8):
+        charsets.append('utf-8-sig')
+    elif body.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        charsets.append('utf-16')
+
+    if headers is not None:
+        charsets.append(headers.get_content_charset())
+
+    match = META_CHARSET.search(body, 0, META_WINDOW)
+
+    if match is not None:
+        charsets.append(match.group(1).decode('ascii'))
+
+    charsets.append('utf-8')
+
+    for charset in charsets:
+        if not charset:
+            continue
+
+        try:
+            return body.decode(charset)
+        except (LookupError, UnicodeDecodeError):
+            pass
+
+    guess = detect(body) if detect is not None else {}
+
+    if (guess.get('confidence') or 0) >= MIN_CONFIDENCE:
+        try:
+            return body.decode(guess['encoding'], errors='replace')
+        except (LookupError, TypeError):
+            pass
+
+    return body.decode('utf-8', errors='replace')
+
+
+class Decompressor:
+    '''
+        Undoes the content encoding of a response body chunk by chunk.
+    '''
+
+    def __init__(self, content_encoding):
+        '''
+            @content_encoding: (string) Value of the Content-Encoding header.
+        '''
+
+        self._stages = []
+
+        # Encodings are listed in the order they were applied.
+        for encoding in reversed((content_encoding or '').lower().split(',')):
+            encoding = encoding.strip()
+
+            if encoding in ('gzip', 'x-gzip'):
+                self._stages.append(zlib.decompressobj(16 + zlib.MAX_WBITS))
+            elif encoding == 'deflate':
+                # Told apart from raw deflate by its first two bytes.
+                self._stages.append(b'')
+            elif encoding == 'br' and brotli is not None:
+                self._stages.append(brotli.Decompressor())
+
+    def decompress(self, data):
+        '''
+            Decompress the next chunk of a body.
+
+            @data: (bytes) Encoded chunk.
+
+            @return: (bytes) Decoded bytes, possibly none yet.
+        '''
+
+        for i in range(len(self._stages)):
+            if not data:
+                break
+
+            data = self._run(i, data)
+
+        return data
+
+    def flush(self):
+        '''
+            Finish decompressing a body.
+
+            @return: (bytes) Remaining decoded bytes.
+        '''
+
+        data = b''
+
+        for i in range(len(self._stages)):
+            if data:
+                data = self._run(i, data)
+
+            stage = self._stages[i]
+
+            if isinstance(stage, bytes) and stage:
+                # Deflate body shorter than a zlib header.
+                data = zlib.decompress(stage, -zlib.MAX_WBITS) + data
+            elif hasattr(stage, 'flush'):
+                data += stage.flush()
+
+        return data
+
+    def _run(self, i, data):
+        '''
+            Run a chunk through a decompression stage.
+
+            @i: (int) Stage index.
+            @data: (bytes) Input of the stage.
+
+            @return: (bytes) Output of the stage.
+        '''
+
+        stage = self._stages[i]
+
+        if isinstance(stage, bytes):
+            data = stage + data
+
+            if len(data) < 2:
+                self._stages[i] = data
+                return b''
+
+            if data[0] & 0x0f == 8 and (data[0] << 8 | data[1]) % 31 == 0:
+                stage = zlib.decompressobj()
+            else:  # Raw deflate stream, without zlib header.
+                stage = zlib.decompressobj(-zlib.MAX_WBITS)
+
+            self._stages[i] = stage
+
+        if hasattr(stage, 'process'):  # Brotli.
+            return stage.process(data)
+
+        return stage.decompress(data)
+
+
+class Scanner:
+    '''
+        Keeps the part of a body from the first occurrence of a marker on,
+        discarding the bytes before it as soon as the marker shows up.
+        Bodies without the marker are kept whole.
+    '''
+
+    def __init__(self, marker):
+        '''
+            @marker: (bytes) Marker.
+        '''
+
+        self.marker = marker
+        self.found = False
+        self.discarded = 0
+
+        self._parts = []
+        self._head = []
+        self._tail = b''
+
+    def feed(self, data):
+        '''
+            Scan the next chunk of a body.
+
+            @data: (bytes) Decoded chunk.
+        '''
+
+        if self.found:
+            self._parts.append(data)
+            return
+
+        # Keep the end of the previous chunk, in case the marker starts there.
+        data = self._tail + data
+        start = data.find(self.marker)
+
+        if start >= 0:
+            self.found = True
+            self.discarded = sum(map(len, self._head)) + start
+            self._head = None
+            self._parts.append(data[start:])
+            return
+
+        end = max(len(data) - len(self.marker) + 1, 0)
+        self._tail = data[end:]
+        self._head.append(data[:end])
+
+    def get_body(self):
+        '''
+            Get what was kept of a body.
+
+            @return: (bytes) Body from the marker on, or the whole body if
+                the marker wasn't found.
+        '''
+
+        if self.found:
+            return b''.join(self._parts)
+
+        return b''.join(self._head) + self._tail
+
+
+class HTTPClient:
+    '''
+        HTTP client with a pool of keep-alive connections per host. Safe to
+        share between threads: each connection serves one request at a time,
+        and is only given back to the pool once its response was fully read.
+    '''
+
+    def __init__(self, headers=None, timeout=60, max_idle=4,
+                 max_redirects=10, host_overrides=None, source_address=None,
+                 proxy=None, cookies=False):
+        '''
+            @headers: ((string, string) list) Headers sent with every request.
+            @timeout: (float) Socket timeout, in seconds.
+            @max_idle: (int) Maximum number of idle connections kept per host.
+            @max_redirects: (int) Maximum number of redirects followed.
+            @host_overrides: (dict) Dict mapping host names to the plain HTTP
+                address ('host:port') their requests are sent to instead, e.g.,
+                a local stand-in server. The Host header is kept.
+            @source_address: (string) Local IP address connections are made
+                from, e.g., one of several addresses of the machine. None lets
+                the system choose.
+            @proxy: (string) URL of the proxy requests go through, e.g.,
+                http://127.0.0.1:8080 or socks5://127.0.0.1:1080. None
+                connects directly.
+            @cookies: (bool) Keep the cookies set by each registrable domain
+                and send them back to it, e.g., to keep a search session
+                across result pages.
+
+            @raise: (ValueError) If the proxy isn't supported.
+        '''
+
+        if proxy is not None:
+            proxy_parts = urlsplit(proxy)
+
+            if proxy_parts.scheme not in ('http', 'socks5') or \
+                    not proxy_parts.hostname:
+                raise ValueError('Unsupported proxy: {}'.format(proxy))
+
+            if proxy_parts.scheme == 'socks5' and socks is None:
+                raise ValueError('SOCKS proxies need the PySocks module')
+
+            proxy = proxy_parts
+
+        self.headers = headers or []
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_redirects = max_redirects
+        self.host_overrides = host_overrides or {}
+        self.source_address = source_address
+        self.proxy = proxy
+        self.cookies = {} if cookies else None
+
+        self._lock = Lock()
+        self._idle = {}
+
+    def get(self, url, headers=None, start=None):
+        '''
+            Send a GET request, following redirects.
+
+            @url: (string) URL.
+            @headers: ((string, string) list) Extra request headers.
+            @start: (bytes) If given, the body is scanned as it's read, and
+                only its part from the first occurrence of start on is kept,
+                or all of it if start doesn't occur.
+
+            @return: (Response) Response.
+
+            @raise: (HTTPError) If the response status is an error.
+        '''
+
+        for _ in range(self.max_redirects + 1):
+            response = self._request(url, headers, start)
+
+            if response.status in REDIRECT_CODES and \
+                    response.getheader('Location'):
+                url = urljoin(url, response.getheader('Location'))
+                continue
+
+            if response.status >= 400:
+                raise HTTPError(url, response.status,
+                                http.client.responses.get(response.status,
+                                                          ''),
+                                response.headers, None)
+
+            return response
+
+        raise HTTPError(url, response.status, 'Too many redirects',
+                        response.headers, None)
+
+    def close(self):
+        '''
+            Close all idle connections.
+        '''
+
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, url, headers, start=None):
+        '''
+            Send a single GET request, reusing an idle connection if possible.
+
+            @url: (string) URL.
+            @headers: ((string, string) list) Extra request headers.
+            @start: (bytes) Marker the body is scanned for, if any.
+
+            @return: (Response) Response.
+        '''
+
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or '/'
+
+        if parts.query:
+            path += '?' + parts.query
+
+        request_headers = {'Accept-Encoding': ENCODINGS}
+        request_headers.update(self.headers)
+        request_headers.update(headers or [])
+
+        if parts.hostname in self.host_overrides:
+            key = ('http', self.host_overrides[parts.hostname])
+            request_headers['Host'] = parts.netloc
+
+        # Plain HTTP proxies take the full URL; HTTPS goes through a tunnel.
+        if self.proxy is not None and self.proxy.scheme == 'http' and \
+                key[0] == 'http':
+            path = 'http://{}{}'.format(key[1], path)
+
+        domain = get_registrable_domain(parts.hostname or '')
+
+        if self.cookies is not None:
+            with self._lock:
+                jar = self.cookies.get(domain)
+
+                if jar:
+                    request_headers['Cookie'] = '; '.join(
+                        '{}={}'.format(name, value)
+                        for name, value in jar.items())
+
+        connection, reused = self._checkout(key, domain)
+
+        try:
+            raw, body = self._send(connection, path, request_headers, domain,
+                                   start)
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError):
+            connection.close()
+
+            if not reused:
+                raise
+
+            # The server closed the idle connection: retry on a new one.
+            connection = self._connect(key, domain)
+
+            try:
+                raw, body = self._send(connection, path, request_headers,
+                                       domain, start)
+            except Exception:
+                connection.close()
+                raise
+        except Exception:
+            connection.close()
+            raise
+
+        if raw.will_close:
+            connection.close()
+        else:
+            self._checkin(key, connection)
+
+        if self.cookies is not None:
+            self._keep_cookies(domain, raw.msg.get_all('Set-Cookie') or [])
+
+        METRICS.add('requests', domain)
+        return Response(url, raw.status, raw.msg, body)
+
+    def _keep_cookies(self, domain, set_cookies):
+        '''
+            Keep the cookies set by a response. Their attributes are ignored:
+            cookies are sent back to the whole registrable domain until they
+            are replaced.
+
+            @domain: (string) Registrable domain of the request host.
+            @set_cookies: (string list) Values of the Set-Cookie headers.
+        '''
+
+        with self._lock:
+            jar = self.cookies.setdefault(domain, {})
+
+            for set_cookie in set_cookies:
+                name, _, value = set_cookie.split(';')[0].partition('=')
+
+                if name.strip():
+                    jar[name.strip()] = value.strip()
+
+    def _send(self, connection, path, headers, domain, start=None):
+        '''
+            Send a GET request on a connection and read its response.
+
+            @connection: (HTTPConnection) Connection.
+            @path: (string) Request path and query.
+            @headers: (dict) Request headers.
+            @domain: (string) Registrable domain of the request host.
+            @start: (bytes) Marker the body is scanned for, if any.
+
+            @return: ((HTTPResponse, bytes) tuple) Response and its body,
+                without content encoding.
+        '''
+
+        sent = perf_counter()
+        connection.request('GET', path, headers=headers)
+        raw = connection.getresponse()
+        first_byte = perf_counter()
+        METRICS.observe('ttfb', domain, first_byte - sent)
+
+        # Decompress each chunk as it arrives, so the encoded body is never
+        # kept whole, and scan it if needed, so the bytes before the marker
+        # aren't kept either.
+        decompressor = Decompressor(raw.getheader('Content-Encoding'))
+        scanner = Scanner(start) if start is not None else None
+        parts = []
+        keep = parts.append if scanner is None else scanner.feed
+        size = 0
+        decompressing = 0
+
+        while True:
+            chunk = raw.read(CHUNK_SIZE)
+            before = perf_counter()
+
+            if not chunk:
+                keep(decompressor.flush())
+                decompressing += perf_counter() - before
+                break
+
+            size += len(chunk)
+            keep(decompressor.decompress(chunk))
+            decompressing += perf_counter() - before
+
+        METRICS.observe('download', domain,
+                        perf_counter() - first_byte - decompressing)
+        METRICS.observe('decompress', domain, decompressing)
+        METRICS.add('bytes', domain, size)
+
+        if scanner is None:
+            return raw, b''.join(parts)
+
+        if scanner.found:
+            METRICS.add('discarded', domain, scanner.discarded)
+        else:
+            METRICS.add('scan_misses', domain)
+
+        return raw, scanner.get_body()
+
+    def _connect(self, key, domain):
+        '''
+            Open a new connection.
+
+            @key: ((string, string) tuple) Scheme and network location.
+            @domain: (string) Registrable domain of the request host.
+
+            @return: (HTTPConnection) Connection.
+        '''
+
+        scheme, netloc = key
+        source_address = (self.source_address, 0) if self.source_address \
+            else None
+        proxy = self.proxy
+        address = netloc
+
+        if proxy is not None and proxy.scheme == 'http':
+            address = proxy.netloc
+
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(
+                address, timeout=self.timeout, source_address=source_address)
+
+            if address != netloc:
+                connection.set_tunnel(netloc)
+        else:
+            connection = http.client.HTTPConnection(
+                address, timeout=self.timeout, source_address=source_address)
+
+        lookup = []
+
+        def create_connection(address, *args):
+            '''
+                Resolve the host on its own, to time the DNS lookup apart from
+                the connection.
+            '''
+
+            if proxy is not None and proxy.scheme == 'socks5':
+                # The proxy resolves the host.
+                return socks.create_connection(
+                    address, *args, proxy_type=socks.SOCKS5,
+                    proxy_addr=proxy.hostname, proxy_port=proxy.port or 1080,
+                    proxy_rdns=True, proxy_username=proxy.username,
+                    proxy_password=proxy.password)
+
+            start = perf_counter()
+            addresses = socket.getaddrinfo(address[0], address[1], 0,
+                                           socket.SOCK_STREAM)
+            lookup.append(perf_counter() - start)
+            error = None
+
+            for _, _, _, _, sockaddr in addresses:
+                try:
+                    return socket.create_connection(sockaddr[:2], *args)
+                except OSError as e:
+                    error = e
+
+            raise error
+
+        connection._create_connection = create_connection
+        start = perf_counter()
+
+        try:
+            connection.connect()
+        except Exception:
+            connection.close()
+            raise
+
+        dns = sum(lookup)
+        METRICS.observe('dns', domain, dns)
+        METRICS.observe('connect', domain, perf_counter() - start - dns)
+
+        return connection
+
+    def _checkout(self, key, domain):
+        '''
+            Take an idle connection from the pool, or open a new one.
+
+            @key: ((string, string) tuple) Scheme and network location.
+            @domain: (string) Registrable domain of the request host.
+
+            @return: ((HTTPConnection, bool) tuple) Connection and whether it
+                was reused.
+        '''
+
+        with self._lock:
+            connections = self._idle.get(key)
+
+            if connections:
+                return connections.pop(), True
+
+        return self._connect(key, domain), False
+
+    def _checkin(self, key, connection):
+        '''
+            Give a connection back to the pool.
+
+            @key: ((string, string) tuple) Scheme and network location.
+            @connection: (HTTPConnection) Connection.
+        '''
+
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+
+        connection.close()
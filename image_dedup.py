@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Find duplicate images among locally available image files, so identical
+images forwarded under different IDs are only searched for once.
+'''
+
+
+from hashlib import sha256
+
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # Perceptual hashing needs Pillow.
+    Image = None
+
+
+# Side of the grayscale thumbnail the difference hash is computed over.
+HASH_SIZE = 8
+
+# Bytes read at a time when hashing image files.
+CHUNK_SIZE = 1 << 16
+
+
+def get_content_hash(path):
+    '''
+        Get the hash of the contents of a file.
+
+        @path: (string) Path of the file.
+
+        @return: (string) SHA-256 hex digest.
+    '''
+
+    digest = sha256()
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_perceptual_hash(path):
+    '''
+        Get the difference hash of an image: one bit per pair of horizontally
+        adjacent pixels of a small grayscale thumbnail, set if the left pixel
+        is brighter. Re-encoded or resized copies of an image have the same
+        or a very close hash.
+
+        @path: (string) Path of the image file.
+
+        @return: (int) HASH_SIZE * HASH_SIZE bits hash.
+    '''
+
+    with Image.open(path) as img:
+        thumbnail = img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE))
+        pixels = list(thumbnail.getdata())
+
+    value = 0
+
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            value = (value << 1) | (left > pixels[row * (HASH_SIZE + 1) +
+                                                  col + 1])
+
+    return value
+
+
+def get_bands(value, n_bands):
+    '''
+        Split a perceptual hash into bands. Two hashes at most n_bands - 1
+        bits apart have at least one identical band.
+
+        @value: (int) Perceptual hash.
+        @n_bands: (int) Number of bands.
+
+        @return: ((int, int) list) Index and value of each band.
+    '''
+
+    n_bits = HASH_SIZE * HASH_SIZE
+    bounds = [n_bits * i // n_bands for i in range(n_bands + 1)]
+
+    bands = []
+
+    for i in range(n_bands):
+        mask = (1 << (bounds[i + 1] - bounds[i])) - 1
+        bands.append((i, (value >> bounds[i]) & mask))
+
+    return bands
+
+
+def find_duplicates(image_ids, images_folder, max_distance=None):
+    '''
+        Map each image to the first image, in the given order, with the same
+        contents. Images without a local file are only mapped to themselves.
+
+        @image_ids: (string iterable) Image IDs, i.e., file names in
+            images_folder.
+        @images_folder: (string) Path of the folder with the image files.
+        @max_distance: (int) Maximum number of different bits between the
+            perceptual hashes of near-duplicate images. None only matches
+            images with identical files.
+
+        @return: (dict) Dict mapping each image ID to the ID of its canonical
+            image.
+    '''
+
+    if max_distance is not None and Image is None:
+        raise RuntimeError('Perceptual hashing requires Pillow.')
+
+    canonical = {}
+    by_content = {}
+    by_band = {}
+    hashes = {}
+
+    for image_id in image_ids:
+        if image_id in canonical:
+            continue
+
+        path = os.path.join(images_folder, image_id)
+        canonical[image_id] = image_id
+
+        if not os.path.isfile(path):
+            continue
+
+        try:
+            content_hash = get_content_hash(path)
+        except OSError:
+            continue
+
+        if content_hash in by_content:
+            canonical[image_id] = by_content[content_hash]
+            continue
+
+        by_content[content_hash] = image_id
+
+        if max_distance is None:
+            continue
+
+        try:
+            value = get_perceptual_hash(path)
+        except (OSError, ValueError):  # Not an image Pillow can read.
+            continue
+
+        bands = get_bands(value, min(max_distance + 1, HASH_SIZE * HASH_SIZE))
+        match = None
+
+        for band in bands:
+            for other in by_band.get(band, []):
+                if bin(value ^ hashes[other]).count('1') <= max_distance:
+                    match = other
+                    break
+
+            if match is not None:
+                break
+
+        if match is not None:
+            canonical[image_id] = match
+            continue
+
+        hashes[image_id] = value
+
+        for band in bands:
+            by_band.setdefault(band, []).append(image_id)
+
+    return canonical
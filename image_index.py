@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Persistent index of crawled images, keyed by image ID, so images that recur
+across days are not crawled again while their sources are fresh.
+'''
+
+
+from threading import Lock
+from time import time
+
+import json
+import sqlite3
+import zlib
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    image_id TEXT PRIMARY KEY,
+    crawled_at REAL NOT NULL,
+    result BLOB NOT NULL
+);
+'''
+
+# Number of seconds in a day.
+DAY = 24 * 60 * 60
+
+
+class ImageIndex:
+    '''
+        SQLite backed index of the last crawl result (sources, fact_checked
+        and fact_check fields) of each image. Safe to share between threads.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) Path of the SQLite database file.
+        '''
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def get(self, image_id):
+        '''
+            Get the last crawl result of an image.
+
+            @image_id: (string) Image ID.
+
+            @return: ((dict, float) tuple) Crawl result and its age, in days,
+                or None if the image was never crawled.
+        '''
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT crawled_at, result FROM images WHERE image_id = ?',
+                (image_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        result = json.loads(zlib.decompress(row[1]).decode())
+        return result, (time() - row[0]) / DAY
+
+    def put(self, image_id, result):
+        '''
+            Store the crawl result of an image.
+
+            @image_id: (string) Image ID.
+            @result: (dict) Crawl result.
+        '''
+
+        blob = zlib.compress(json.dumps(result).encode())
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?)',
+                             (image_id, time(), blob))
+            self._db.commit()
+
+    def close(self):
+        '''
+            Close the index.
+        '''
+
+        with self._lock:
+            self._db.close()
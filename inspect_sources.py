@@ -1,4 +1,4 @@
-#!/usr/bin/env python2
+#!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
 '''
@@ -8,11 +8,11 @@ Run analyses on collected image sources.
 '''
 
 from argparse import ArgumentParser
-from tldextract import extract
-from urlparse import urlparse
+from url_utils import get_domain_name, get_host
 
-import json
+import json_stream
 import os
+import pandas as pd
 
 
 # Add command line arguments.
@@ -23,54 +23,98 @@ parser.add_argument('json_folder', type=str,
 parser.add_argument('--c', action='store_true',
                     help='Indicates if the JSON file was generated from a '
                     'CSV file with image data.')
+parser.add_argument('--dates', action='store_true',
+                    help='Also print the number of sources per date and '
+                    'domain.')
 
 args = parser.parse_args()
 
+# Network location of a URL.
+NETLOC_PATTERN = r'^[A-Za-z][A-Za-z0-9+.-]*://([^/?#]*)'
+
 
 def get_files():
     json_filenames = []
     for json_f in os.listdir(args.json_folder):
         if os.path.isfile(os.path.join(args.json_folder, json_f)):
-            if json_f.endswith('.json'):
+            if json_f.endswith('.json') or json_f.endswith('.jsonl'):
                 json_filenames.append(os.path.join(args.json_folder, json_f))
 
     return json_filenames
 
 
-def main():
-    json_filenames = get_files()
-    source_freq = {}
-    sites = {}
+def load_sources(json_filenames):
+    '''
+        Load the sources of all images into a table.
 
-    for filename in json_filenames:
-        json_file = open(filename, 'r')
-        data = json.load(json_file)
+        @json_filenames: (string list) Paths of the JSON files.
 
-        for img_id in data:
-            if not args.c and 'sources' not in data[img_id]:
+        @return: (DataFrame) Table with a source and date column, one row per
+            source of each image.
+    '''
+
+    sources = []
+    dates = []
+
+    for filename in json_filenames:
+        for _, img_data in json_stream.iter_records(filename):
+            if not args.c and 'sources' not in img_data:
                 continue
 
-            source_data = data[img_id] if args.c else data[img_id]['sources']
+            source_data = img_data if args.c else img_data['sources']
 
             for source, date in source_data:
-                domain = extract(source).domain
-                netloc = str(urlparse(source).netloc)
+                sources.append(source)
+                dates.append(date)
 
-                if domain not in sites:
-                    sites[domain] = [netloc]
-                elif netloc not in sites[domain]:
-                    sites[domain].append(netloc)
+    return pd.DataFrame({'source': pd.Series(sources, dtype='string'),
+                         'date': pd.Series(dates, dtype='string')})
 
-                source_freq[domain] = source_freq.get(domain, 0) + 1
 
-        json_file.close()
+def add_domains(table):
+    '''
+        Add the network location and domain columns to a source table. Each
+        distinct network location is only resolved once. Sources without a
+        scheme have no network location, so their domain is resolved from the
+        source itself.
+
+        @table: (DataFrame) Source table.
+    '''
+
+    netlocs = table['source'].str.extract(NETLOC_PATTERN, expand=False) \
+        .fillna('')
+    hosts = netlocs.where(netlocs != '', table['source']).astype('category')
+    domains = hosts.cat.categories.map(
+        lambda host: get_domain_name(get_host(host))).to_numpy()
+
+    table['netloc'] = netlocs.astype('category')
+    table['domain'] = pd.Series(domains[hosts.cat.codes.to_numpy()],
+                                index=table.index, dtype='string')
+
+
+def main():
+    table = load_sources(get_files())
+    add_domains(table)
 
-    source_freq_list = sorted(
-        ((v, k) for k, v in source_freq.items()), reverse=True)
+    by_domain = table.groupby('domain', sort=False, observed=True)
+    summary = pd.DataFrame({'frequency': by_domain.size(),
+                            'websites': by_domain['netloc'].unique()})
+    summary = summary.reset_index().sort_values(['frequency', 'domain'],
+                                                ascending=False)
 
     print('FREQUENCY\tDOMAIN\tWEBSITES')
-    for pair in source_freq_list:
-        print('{}\t{}\t{}'.format(pair[0], pair[1], sites[pair[1]]))
+    for row in summary.itertuples(index=False):
+        print('{}\t{}\t{}'.format(row.frequency, row.domain,
+                                  list(row.websites)))
+
+    if args.dates:
+        by_date = table.groupby(['date', 'domain'], observed=True).size() \
+            .reset_index(name='frequency') \
+            .sort_values(['date', 'frequency'], ascending=[True, False])
+
+        print('\nDATE\tDOMAIN\tFREQUENCY')
+        for row in by_date.itertuples(index=False):
+            print('{}\t{}\t{}'.format(row.date, row.domain, row.frequency))
 
 
 main()
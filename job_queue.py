@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Persistent job queues in a SQLite database, used as a local broker between
+the image monitor, the crawl service and whatever consumes its results.
+'''
+
+
+from threading import Lock
+from time import time
+
+import json
+import sqlite3
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    leased_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (queue, id);
+'''
+
+# Jobs with a key are unique within their queue. Added after the table, so
+# older databases get the column too.
+KEY_SCHEMA = '''
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_key ON jobs (queue, key);
+'''
+
+
+class JobQueue:
+    '''
+        SQLite backed set of named FIFO queues. Taking a job leases it: it
+        stays in the queue, invisible to other consumers, until it's acked or
+        its lease expires, so jobs of a consumer that dies are taken again.
+        Safe to share between threads and processes.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) Path of the SQLite database file.
+        '''
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None, timeout=60)
+        self._db.executescript(SCHEMA)
+
+        columns = [row[1] for row in
+                   self._db.execute('PRAGMA table_info(jobs)')]
+
+        if 'key' not in columns:
+            self._db.execute('ALTER TABLE jobs ADD COLUMN key TEXT')
+
+        self._db.executescript(KEY_SCHEMA)
+
+    def put(self, queue, payload, key=None):
+        '''
+            Add a job to a queue.
+
+            @queue: (string) Queue name.
+            @payload: (object) JSON serializable job.
+            @key: (string) Job key. If given, the job isn't added if the
+                queue already has a job with the same key.
+
+            @return: (bool) False iff the job wasn't added.
+        '''
+
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO jobs (queue, payload, created_at, key) '
+                'VALUES (?, ?, ?, ?)', (queue, json.dumps(payload), time(),
+                                        key))
+            return cursor.rowcount > 0
+
+    def has(self, queue, key):
+        '''
+            Check if a queue has a job with a key, leased or not.
+
+            @queue: (string) Queue name.
+            @key: (string) Job key.
+
+            @return: (bool) True iff the queue has such a job.
+        '''
+
+        with self._lock:
+            return self._db.execute(
+                'SELECT 1 FROM jobs WHERE queue = ? AND key = ?',
+                (queue, key)).fetchone() is not None
+
+    def take(self, queue, lease=600):
+        '''
+            Take the oldest available job of a queue.
+
+            @queue: (string) Queue name.
+            @lease: (float) Number of seconds the job is reserved for.
+
+            @return: ((int, object) tuple) Job ID and payload, or None if the
+                queue has no available job.
+        '''
+
+        now = time()
+
+        with self._lock:
+            # Lock the database, so no other process takes the same job.
+            self._db.execute('BEGIN IMMEDIATE')
+
+            try:
+                row = self._db.execute(
+                    'SELECT id, payload FROM jobs WHERE queue = ? AND '
+                    '(leased_until IS NULL OR leased_until < ?) '
+                    'ORDER BY id LIMIT 1', (queue, now)).fetchone()
+
+                if row is not None:
+                    self._db.execute(
+                        'UPDATE jobs SET leased_until = ? WHERE id = ?',
+                        (now + lease, row[0]))
+
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+
+        return row[0], json.loads(row[1])
+
+    def ack(self, job_id):
+        '''
+            Remove a finished job from its queue.
+
+            @job_id: (int) Job ID.
+        '''
+
+        with self._lock:
+            self._db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def size(self, queue):
+        '''
+            Get the number of jobs in a queue, leased or not.
+
+            @queue: (string) Queue name.
+
+            @return: (int) Number of jobs.
+        '''
+
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM jobs WHERE queue = ?',
+                                    (queue,)).fetchone()[0]
+
+    def close(self):
+        '''
+            Close the queue.
+        '''
+
+        with self._lock:
+            self._db.close()
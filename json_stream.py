@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Read and write image data files one record at a time.
+
+Image data files are either JSON files holding a single dict that maps each
+image key to its record, or JSON Lines files where each line holds a dict
+with a single image key and its record. JSON files are only streamed if the
+ijson module is installed; JSON Lines files are always streamed.
+'''
+
+
+import json
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def is_json_lines(path):
+    '''
+        Check if a file is a JSON Lines file.
+
+        @path: (string) File path.
+
+        @return: (bool) True iff the file has a JSON Lines extension.
+    '''
+
+    return path.endswith('.jsonl')
+
+
+def iter_records(path):
+    '''
+        Go through the records of an image data file.
+
+        @path: (string) File path.
+
+        @return: ((string, dict) generator) Key and record of each image.
+    '''
+
+    with open(path, 'r') as data_file:
+        if is_json_lines(path):
+            for line in data_file:
+                if line.strip():
+                    yield from json.loads(line).items()
+        elif ijson is not None:
+            yield from ijson.kvitems(data_file, '', use_float=True)
+        else:
+            yield from json.load(data_file).items()
+
+
+class JSONWriter:
+    '''
+        Writes records to a JSON file holding a single dict. Records are kept
+        in memory until the writer is closed.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) File path.
+        '''
+
+        self.path = path
+        self.records = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+
+    def write(self, key, record):
+        '''
+            Write a record.
+
+            @key: (string) Image key.
+            @record: (dict) Image record.
+        '''
+
+        self.records[int(key)] = record
+
+    def close(self):
+        '''
+            Write the records to the file.
+        '''
+
+        with open(self.path, 'w') as output_file:
+            json.dump(self.records, output_file, indent=4, sort_keys=True)
+
+
+class JSONLinesWriter:
+    '''
+        Writes records to a JSON Lines file, one line per record, as soon as
+        they are written.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) File path.
+        '''
+
+        self.path = path
+        self._file = open(path, 'w')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, key, record):
+        '''
+            Write a record.
+
+            @key: (string) Image key.
+            @record: (dict) Image record.
+        '''
+
+        self._file.write(json.dumps({key: record}, sort_keys=True) + '\n')
+        self._file.flush()
+
+    def close(self):
+        '''
+            Close the file.
+        '''
+
+        self._file.close()
+
+
+def open_writer(path):
+    '''
+        Open a record writer suited to a file.
+
+        @path: (string) File path.
+
+        @return: (JSONWriter or JSONLinesWriter) Record writer.
+    '''
+
+    if is_json_lines(path):
+        return JSONLinesWriter(path)
+
+    return JSONWriter(path)
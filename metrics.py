@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Crawl instrumentation: time spent in each phase of a request (DNS lookup,
+connect, time to first byte, download, decoding, parsing, sleeping) and bytes
+transferred, per domain. Metrics can be written periodically to a JSON file
+or a Prometheus text file, or served in Prometheus text format over HTTP.
+'''
+
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+
+import atexit
+import json
+import os
+
+
+# Prefix of the Prometheus metric names.
+PREFIX = 'locus_crawler'
+
+
+class Metrics:
+    '''
+        Thread-safe metrics registry. Timers keep the number of observations,
+        and their total and maximum duration; counters keep a total.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._timers = {}
+        self._counters = {}
+        self.started = time()
+
+    def observe(self, name, domain, seconds):
+        '''
+            Record a duration.
+
+            @name: (string) Timer name, e.g., ttfb.
+            @domain: (string) Domain the duration is about.
+            @seconds: (float) Duration, in seconds.
+        '''
+
+        with self._lock:
+            timer = self._timers.get((name, domain))
+
+            if timer is None:
+                self._timers[(name, domain)] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+
+    def add(self, name, domain, value=1):
+        '''
+            Increase a counter.
+
+            @name: (string) Counter name, e.g., bytes.
+            @domain: (string) Domain the counter is about.
+            @value: (float) Increment.
+        '''
+
+        with self._lock:
+            key = (name, domain)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, domain):
+        '''
+            Time a block of code.
+
+            @name: (string) Timer name.
+            @domain: (string) Domain the block is about.
+        '''
+
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(name, domain, perf_counter() - start)
+
+    def to_dict(self):
+        '''
+            Get a snapshot of the metrics.
+
+            @return: (dict) Dict mapping each domain to its timers (count,
+                total and maximum seconds) and counters.
+        '''
+
+        snapshot = {}
+
+        with self._lock:
+            for (name, domain), (count, total, top) in self._timers.items():
+                snapshot.setdefault(domain, {})[name] = {
+                    'count': count, 'seconds': total, 'max_seconds': top}
+
+            for (name, domain), total in self._counters.items():
+                snapshot.setdefault(domain, {})[name] = total
+
+        return snapshot
+
+    def to_prometheus(self):
+        '''
+            Get the metrics in Prometheus text format.
+
+            @return: (string) Metrics.
+        '''
+
+        lines = []
+
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+
+        for (name, domain), (count, total, _) in timers:
+            labels = '{{domain="{}"}}'.format(domain)
+            lines.append('{}_{}_seconds_sum{} {}'.format(PREFIX, name, labels,
+                                                         total))
+            lines.append('{}_{}_seconds_count{} {}'.format(PREFIX, name,
+                                                           labels, count))
+
+        for (name, domain), total in counters:
+            lines.append('{}_{}_total{{domain="{}"}} {}'.format(
+                PREFIX, name, domain, total))
+
+        lines.append('{}_uptime_seconds {}'.format(PREFIX,
+                                                   time() - self.started))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        '''
+            Write the metrics to a file, replacing it at once so scrapers
+            never read a partial file.
+
+            @path: (string) File path. JSON if it ends with .json, Prometheus
+                text format otherwise.
+        '''
+
+        if path.endswith('.json'):
+            text = json.dumps({'time': time(), 'domains': self.to_dict()},
+                              indent=4, sort_keys=True)
+        else:
+            text = self.to_prometheus()
+
+        partial_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(partial_path, 'w') as metrics_file:
+            metrics_file.write(text)
+
+        os.replace(partial_path, path)
+
+
+# Metrics shared by all fetches.
+METRICS = Metrics()
+
+
+def start_writer(path, interval=60):
+    '''
+        Write the metrics to a file every interval seconds, and once more at
+        exit.
+
+        @path: (string) File path. JSON if it ends with .json, Prometheus text
+            format otherwise.
+        @interval: (float) Number of seconds between writes.
+    '''
+
+    stopped = Event()
+
+    def write_periodically():
+        while not stopped.wait(interval):
+            METRICS.write(path)
+
+    def stop():
+        stopped.set()
+        METRICS.write(path)
+
+    Thread(target=write_periodically, daemon=True).start()
+    atexit.register(stop)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    '''
+        Serves the metrics in Prometheus text format.
+    '''
+
+    def do_GET(self):
+        body = METRICS.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(port):
+    '''
+        Serve the metrics over HTTP, in a background thread.
+
+        @port: (int) Port to listen on.
+
+        @return: (ThreadingHTTPServer) Server.
+    '''
+
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
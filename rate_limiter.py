@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Per-domain token bucket rate limiter shared by every fetch of the crawler.
+'''
+
+
+from metrics import METRICS
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from url_utils import get_host, get_registrable_domain
+
+
+# Seconds between requests to hosts without a budget of their own.
+DEFAULT_INTERVAL = (1, 2)
+
+# Adaptive pacing: every block multiplies all intervals by SLOWDOWN, up to
+# MAX_SCALE times the configured ones, and every CLEAN_STREAK requests in a row
+# without a block take SPEEDUP off the multiplier, down to the configured
+# intervals.
+SLOWDOWN = 2
+MAX_SCALE = 32
+CLEAN_STREAK = 20
+SPEEDUP = 0.25
+
+
+class TokenBucket:
+    '''
+        Token bucket refilled at one token every interval_min to interval_max
+        seconds, holding at most capacity tokens. Callers may take tokens the
+        bucket doesn't have yet: they get the time to wait until the token is
+        theirs.
+    '''
+
+    def __init__(self, interval_min, interval_max, capacity=1):
+        '''
+            @interval_min: (float) Minimum number of seconds between tokens.
+            @interval_max: (float) Maximum number of seconds between tokens.
+            @capacity: (int) Maximum number of tokens held, i.e., how many
+                requests can be done in a burst.
+        '''
+
+        self.interval_min = interval_min
+        self.interval_max = interval_max
+        self.capacity = capacity
+
+        self.tokens = capacity
+        self.updated = monotonic()
+
+    def take(self, now, scale=1):
+        '''
+            Take a token.
+
+            @now: (float) Current monotonic time.
+            @scale: (float) Multiplier of the intervals between tokens.
+
+            @return: (float) Number of seconds to wait before using the token.
+        '''
+
+        interval = scale * (self.interval_min + self.interval_max) / 2
+
+        if interval <= 0:
+            return 0
+
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) / interval)
+        self.updated = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0
+
+        # Out of budget: wait for the missing token, with some jitter so the
+        # crawler looks slightly more human.
+        return -self.tokens * interval + \
+            uniform(0, scale * (self.interval_max - self.interval_min))
+
+
+class RateLimiter:
+    '''
+        Thread-safe rate limiter with a token bucket per domain and an
+        optional global request rate. Callers only wait when the budget of
+        the host they are about to request is exhausted. All budgets are
+        scaled by an adaptive multiplier that grows when requests get blocked
+        and shrinks back after streaks of clean requests.
+    '''
+
+    def __init__(self, rate=None):
+        '''
+            @rate: (float) Maximum number of requests per second, over all
+                hosts. None means no global limit.
+        '''
+
+        self._lock = Lock()
+        self._global = TokenBucket(1 / rate, 1 / rate) if rate else None
+        self._intervals = {}
+        self._buckets = {}
+        self._waited = {}
+        self._requests = {}
+        self.scale = 1
+        self._streak = 0
+
+    def set_interval(self, domain, interval_min, interval_max, capacity=1):
+        '''
+            Set the budget of a domain and its subdomains. Does nothing if the
+            budget is unchanged.
+
+            @domain: (string) Domain, e.g., google.com.br.
+            @interval_min: (float) Minimum number of seconds between requests.
+            @interval_max: (float) Maximum number of seconds between requests.
+            @capacity: (int) Number of requests that can be done in a burst.
+        '''
+
+        budget = (interval_min, interval_max, capacity)
+
+        with self._lock:
+            if self._intervals.get(domain) == budget:
+                return
+
+            self._intervals[domain] = budget
+            self._buckets[domain] = TokenBucket(*budget)
+
+    def get_key(self, host):
+        '''
+            Get the budget key of a host: the most specific domain with a
+            budget of its own, or the registrable domain of the host.
+
+            @host: (string) Host name.
+
+            @return: (string) Budget key.
+        '''
+
+        best = get_registrable_domain(host)
+        best_len = -1
+
+        for domain in self._intervals:
+            if (host == domain or host.endswith('.' + domain)) and \
+                    len(domain) > best_len:
+                best = domain
+                best_len = len(domain)
+
+        return best
+
+    def wait(self, url):
+        '''
+            Block until the budget of the host of a URL allows a request.
+
+            @url: (string) URL about to be requested.
+
+            @return: (float) Number of seconds waited.
+        '''
+
+        host = get_host(url)
+
+        # Take the tokens, then sleep outside the lock so other threads can
+        # take theirs.
+        with self._lock:
+            key = self.get_key(host)
+
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(*DEFAULT_INTERVAL)
+
+            now = monotonic()
+            delay = self._buckets[key].take(now, self.scale)
+
+            if self._global is not None:
+                delay = max(delay, self._global.take(now, self.scale))
+
+            self._waited[key] = self._waited.get(key, 0) + delay
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+        if delay > 0:
+            sleep(delay)
+
+        METRICS.observe('sleep', key, delay)
+        return delay
+
+    def on_block(self):
+        '''
+            Slow down all requests after a request was blocked.
+
+            @return: (float) New multiplier of the intervals between requests.
+        '''
+
+        with self._lock:
+            self.scale = min(self.scale * SLOWDOWN, MAX_SCALE)
+            self._streak = 0
+            return self.scale
+
+    def on_success(self):
+        '''
+            Record a request that wasn't blocked, speeding requests up after a
+            streak of them.
+        '''
+
+        with self._lock:
+            if self.scale <= 1:
+                return
+
+            self._streak += 1
+
+            if self._streak >= CLEAN_STREAK:
+                self.scale = max(self.scale - SPEEDUP, 1)
+                self._streak = 0
+
+    def get_stats(self):
+        '''
+            Get how long callers waited for each domain.
+
+            @return: (dict) Dict mapping each budget key to a dict with the
+                number of requests and the total seconds waited.
+        '''
+
+        with self._lock:
+            return {key: {'requests': self._requests[key],
+                          'waited': self._waited[key]}
+                    for key in self._requests}
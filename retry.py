@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Bounded retries of failed requests: errors are classified, transient ones are
+retried with capped exponential backoff and jitter, and hosts that keep
+failing are parked by a circuit breaker for a while, so requests to them fail
+fast while requests to other hosts go on.
+'''
+
+
+from metrics import METRICS
+from random import uniform
+from threading import Lock
+from time import monotonic, sleep
+from urllib.error import HTTPError
+
+import http.client
+
+
+# Error classes.
+PERMANENT = 'permanent'  # Retrying won't help, e.g., 404.
+TRANSIENT = 'transient'  # Timeouts, connection errors, 5xx.
+THROTTLED = 'throttled'  # The server asked us to slow down, e.g., 429.
+BLOCKED = 'blocked'  # The server answered with a CAPTCHA or block page.
+
+
+class FetchError(Exception):
+    '''
+        A request failed for good: its error is permanent, it ran out of
+        attempts or its host is parked.
+    '''
+
+    def __init__(self, key, kind, error=None):
+        '''
+            @key: (string) Host key of the request.
+            @kind: (string) Error class.
+            @error: (Exception) Last error, if any.
+        '''
+
+        super().__init__('{} error on {}: {}'.format(kind, key, error))
+        self.key = key
+        self.kind = kind
+        self.error = error
+
+
+class CircuitOpenError(FetchError):
+    '''
+        The host of a request is parked by the circuit breaker.
+    '''
+
+    def __init__(self, key):
+        '''
+            @key: (string) Host key of the request.
+        '''
+
+        super().__init__(key, 'parked')
+
+
+class BlockedError(FetchError):
+    '''
+        The server answered a request with a CAPTCHA or block page instead of
+        the requested page. Retrying right away only prolongs the block.
+    '''
+
+    def __init__(self, key, url):
+        '''
+            @key: (string) Host key of the request.
+            @url: (string) URL of the block page.
+        '''
+
+        super().__init__(key, BLOCKED, url)
+
+
+def classify(error):
+    '''
+        Classify a request error.
+
+        @error: (Exception) Error.
+
+        @return: (string) PERMANENT, TRANSIENT or THROTTLED.
+    '''
+
+    if isinstance(error, HTTPError):
+        if error.code in (429, 503):
+            return THROTTLED
+
+        if error.code == 408 or error.code >= 500:
+            return TRANSIENT
+
+        return PERMANENT
+
+    # Malformed URLs and certificate errors (also a ValueError).
+    if isinstance(error, ValueError):
+        return PERMANENT
+
+    if isinstance(error, (OSError, http.client.HTTPException)):
+        return TRANSIENT
+
+    return PERMANENT
+
+
+class RetryPolicy:
+    '''
+        Number of attempts and backoff of failed requests.
+    '''
+
+    def __init__(self, max_attempts=5, base=2, cap=300):
+        '''
+            @max_attempts: (int) Maximum number of attempts of a request.
+            @base: (float) Backoff after the first failure, in seconds.
+            @cap: (float) Maximum backoff, in seconds.
+        '''
+
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+
+    def get_delay(self, attempt, error):
+        '''
+            Get the backoff before retrying a request.
+
+            @attempt: (int) Number of failed attempts so far, minus one.
+            @error: (Exception) Last error.
+
+            @return: (float) Number of seconds to wait: between half and all
+                of the capped exponential backoff, or what the server asked
+                for in a Retry-After header, if longer.
+        '''
+
+        delay = min(self.cap, self.base * 2 ** attempt)
+        delay = uniform(delay / 2, delay)
+
+        if isinstance(error, HTTPError) and error.headers is not None:
+            retry_after = error.headers.get('Retry-After')
+
+            if retry_after is not None and retry_after.strip().isdigit():
+                delay = max(delay, min(self.cap, int(retry_after)))
+
+        return delay
+
+
+class CircuitBreaker:
+    '''
+        Per host circuit breaker. After threshold failed requests in a row,
+        i.e., requests that ran out of attempts, a host is parked for cooldown
+        seconds. Then a single request is let through: if it succeeds the
+        host is back, otherwise it's parked again. Safe to share between
+        threads.
+    '''
+
+    def __init__(self, threshold=5, cooldown=300):
+        '''
+            @threshold: (int) Number of failures in a row that park a host.
+            @cooldown: (float) Number of seconds a host stays parked.
+        '''
+
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self._lock = Lock()
+        self._failures = {}
+        self._parked_until = {}
+
+    def allow(self, key):
+        '''
+            Check if a request to a host can be made.
+
+            @key: (string) Host key.
+
+            @return: (bool) False iff the host is parked.
+        '''
+
+        with self._lock:
+            parked_until = self._parked_until.get(key)
+
+            if parked_until is None:
+                return True
+
+            if monotonic() < parked_until:
+                return False
+
+            # Let this request probe the host, keeping the others parked.
+            self._parked_until[key] = monotonic() + self.cooldown
+            return True
+
+    def success(self, key):
+        '''
+            Record a successful request.
+
+            @key: (string) Host key.
+        '''
+
+        with self._lock:
+            self._failures.pop(key, None)
+            self._parked_until.pop(key, None)
+
+    def failure(self, key):
+        '''
+            Record a request that ran out of attempts.
+
+            @key: (string) Host key.
+        '''
+
+        with self._lock:
+            self._failures[key] = self._failures.get(key, 0) + 1
+
+            if self._failures[key] >= self.threshold:
+                self._parked_until[key] = monotonic() + self.cooldown
+
+    def get_parked(self):
+        '''
+            Get the parked hosts.
+
+            @return: (string list) Keys of the parked hosts.
+        '''
+
+        now = monotonic()
+
+        with self._lock:
+            return [key for key, parked_until in self._parked_until.items()
+                    if parked_until > now]
+
+
+def call(function, key, policy, breaker=None):
+    '''
+        Call a request function, retrying it on transient errors.
+
+        @function: (function) Function without arguments that makes the
+            request. FetchErrors it raises are raised as they are.
+        @key: (string) Host key of the request, e.g., its registrable domain.
+        @policy: (RetryPolicy) Retry policy.
+        @breaker: (CircuitBreaker) Circuit breaker, if any.
+
+        @return: (object) Result of the function.
+
+        @raise: (FetchError) If the request failed for good.
+    '''
+
+    for attempt in range(max(policy.max_attempts, 1)):
+        if breaker is not None and not breaker.allow(key):
+            raise CircuitOpenError(key)
+
+        try:
+            result = function()
+        except FetchError:
+            raise
+        except Exception as error:
+            kind = classify(error)
+            METRICS.add('errors', key)
+
+            if kind == PERMANENT:
+                raise FetchError(key, kind, error)
+
+            if attempt + 1 >= policy.max_attempts:
+                # A single failure per request, so one dead URL doesn't park
+                # its whole host.
+                if breaker is not None:
+                    breaker.failure(key)
+
+                raise FetchError(key, kind, error)
+
+            delay = policy.get_delay(attempt, error)
+            print('\t\t[-] {} ({}), retrying in {:.1f} s.'.format(
+                error, kind, delay))
+            sleep(delay)
+            continue
+
+        if breaker is not None:
+            breaker.success(key)
+
+        return result
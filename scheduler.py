@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Crawl the search result pages of many images at the same time. Requests are
+paced by the per-domain budgets of a single shared rate limiter, so the crawl
+speed depends on the configured request rates rather than on the number of
+images.
+'''
+
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, \
+    as_completed, wait
+from rate_limiter import RateLimiter
+from retry import FetchError
+
+import checkpoint
+import google_crawler as gc
+import json_stream
+
+
+def crawl_image(link, sleep_min, sleep_max, pages):
+    '''
+        Collect the sources of an image, and fact check them if needed.
+
+        @link: (string) Google Search by Image link of the image.
+        @sleep_min: (float) Minimum number of seconds between requests to
+            Google.
+        @sleep_max: (float) Maximum number of seconds between requests to
+            Google.
+        @pages: (int) Number of search result pages to go through.
+
+        @return: (dict) Sources, fact_checked and, if the image was fact
+            checked, fact_check fields of the image. If a pagination policy
+            is set, also its pagination stats, in the pagination field. If
+            its result pages couldn't be fetched, only an error field with
+            the error class (blocked if Google answered with a block page),
+            so the image is deferred to a later run instead of being recorded
+            without sources.
+    '''
+
+    stats = {}
+
+    try:
+        sources = gc.get_sources(link, sleep_min, sleep_max, pages, stats)
+    except FetchError as error:
+        print('\t[-] {}'.format(error))
+        return {'error': error.kind}
+
+    fact_checked = gc.is_fact_checked(sources)
+    result = {'sources': sources, 'fact_checked': fact_checked}
+
+    if gc.NOVELTY is not None or gc.STOP_AT_FACT_CHECK:
+        result['pagination'] = stats
+
+    if fact_checked:
+        result['fact_check'] = gc.get_fact_check(sources, sleep_min,
+                                                 sleep_max)
+
+    return result
+
+
+def run(crawl_function, job_args):
+    '''
+        Run a single crawl job, with all of its requests going through the
+        same egress if there's an egress pool.
+
+        @crawl_function: (function) Function that runs the job.
+        @job_args: (tuple) Arguments of crawl_function.
+
+        @return: (object) Result of the job.
+    '''
+
+    with gc.egress_session():
+        return crawl_function(*job_args)
+
+
+def crawl(jobs, crawl_function, workers, rate):
+    '''
+        Run crawl jobs concurrently.
+
+        @jobs: ((key, tuple) iterable) Jobs: a key that identifies the job
+            and the arguments of crawl_function. Jobs are only taken from it
+            as workers become free, so it can be a generator.
+        @crawl_function: (function) Function that runs a single job.
+        @workers: (int) Number of jobs to run at the same time.
+        @rate: (float) Maximum number of requests per second, over all hosts.
+            None means no global limit. Each egress of an egress pool has its
+            own limit.
+
+        @return: ((key, object) generator) Key and result of each job, in
+            order of completion.
+    '''
+
+    workers = max(workers, 1)
+    previous = gc.set_limiter(RateLimiter(rate))
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+
+            for key, job_args in jobs:
+                # Keep only a few jobs queued, so memory use doesn't grow with
+                # the number of jobs.
+                while len(pending) >= 2 * workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+                    for future in done:
+                        yield pending.pop(future), future.result()
+
+                pending[executor.submit(run, crawl_function, job_args)] = key
+
+            for future in as_completed(pending):
+                yield pending[future], future.result()
+    finally:
+        gc.set_limiter(previous)
+
+
+def crawl_file(input_path, output_path, duplicates, crawl_function,
+               get_job_args, workers, rate, min_share, index=None,
+               max_age=None, log=print):
+    '''
+        Crawl the images of an input file into an output file. Finished
+        images are recorded in a checkpoint journal, so an interrupted run
+        resumes from them, and each set of duplicate images is only searched
+        for once. Images whose crawl failed are left for a later run: they
+        aren't journaled or indexed, and the journal is kept, so it crawls
+        only those.
+
+        @input_path: (string) Path of the input file.
+        @output_path: (string) Path of the output file.
+        @duplicates: (dict) Dict mapping each image ID to the ID of the image
+            searched for in its place.
+        @crawl_function: (function) Function that crawls a single image.
+        @get_job_args: (function) Called with the data of an image to crawl
+            and its indexed result, if any. Returns the arguments of
+            crawl_function.
+        @workers: (int) Number of images to crawl at the same time.
+        @rate: (float) Maximum number of requests per second, over all hosts.
+        @min_share: (int) Images shared fewer times are written as they are.
+        @index: (ImageIndex) Index of crawled images, updated with the new
+            results. None disables it.
+        @max_age: (float) Images indexed within this many days aren't crawled
+            again.
+        @log: (function) Called with a line about each image found in the
+            index, copied from a duplicate or crawled.
+
+        @return: (int) Number of images left for a later run.
+    '''
+
+    # Resume from the images finished by a previous run.
+    journal_path = checkpoint.get_journal_path(output_path)
+    finished = checkpoint.load(journal_path)
+
+    # Keep the results of the images searched for in place of others until
+    # all of their duplicates are written.
+    shared = set(duplicates[i] for i in duplicates if duplicates[i] != i)
+    results = {}
+    crawling = {}
+    deferred = 0
+
+    def record(img_id, img_data, result):
+        journal.append(img_id, result)
+
+        if index is not None:
+            index.put(img_data['imageID'], result)
+
+        img_data.update(result)
+        writer.write(img_id, img_data)
+
+    def get_jobs():
+        '''
+            Go through the input file, writing the images that don't need to
+            be crawled and yielding the ones that do.
+        '''
+
+        for img_id, img_data in json_stream.iter_records(input_path):
+            image_id = img_data['imageID']
+            canonical = duplicates.get(image_id, image_id)
+
+            if img_id in finished:
+                img_data.update(finished[img_id])
+                writer.write(img_id, img_data)
+
+                if canonical in shared:
+                    results[canonical] = finished[img_id]
+
+                continue
+
+            if img_data['shareNumber'] < min_share:
+                writer.write(img_id, img_data)
+                continue
+
+            indexed = index.get(image_id) if index is not None else None
+
+            if indexed is not None and indexed[1] <= max_age:
+                log('[+] Image {} (fresh)'.format(image_id))
+                img_data.update(indexed[0])
+                writer.write(img_id, img_data)
+            elif canonical in results:
+                log('[+] Image {} (duplicate of {})'.format(image_id,
+                                                           canonical))
+                record(img_id, img_data, results[canonical])
+            elif canonical in crawling:
+                crawling[canonical].append((img_id, img_data))
+            else:
+                crawling[canonical] = [(img_id, img_data)]
+                previous = indexed[0] if indexed is not None else None
+                yield canonical, get_job_args(img_data, previous)
+
+    with checkpoint.Journal(journal_path) as journal, \
+            json_stream.open_writer(output_path) as writer:
+        for canonical, result in crawl(get_jobs(), crawl_function, workers,
+                                       rate):
+            failed = 'error' in result
+
+            if canonical in shared and not failed:
+                results[canonical] = result
+
+            for img_id, img_data in crawling.pop(canonical):
+                log('[+] Image {}'.format(img_data['imageID']))
+
+                if failed:
+                    deferred += 1
+                    img_data.update(result)
+                    writer.write(img_id, img_data)
+                else:
+                    record(img_id, img_data, result)
+
+    if not deferred:
+        journal.remove()
+
+    return deferred
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Collect sources or fact check the images of a folder of JSON files with
+several worker processes, possibly on several machines sharing the folder.
+
+Each file is split into shards of images. Shards are tasks in a work-queue
+directory: a worker claims a task by moving it from tasks/ to claimed/, and
+writes the results of its shard to results/. Once all shards of a file are
+done, the file is merged, in the order of the input file, into sources/ or
+fact_checks/, so the output doesn't depend on which worker did what.
+'''
+
+
+from argparse import ArgumentParser
+from egress_pool import EgressPool
+from http_cache import HTTPCache
+from multiprocessing import Process
+from time import time
+from verdict_store import VerdictStore
+
+import checkpoint
+import google_crawler as gc
+import json
+import json_stream
+import metrics
+import os
+import scheduler
+import socket
+
+
+# Add command line arguments.
+parser = ArgumentParser()
+
+parser.add_argument('json_folder', type=str,
+                    help='Path of the folder that contains the JSON files.')
+parser.add_argument('queue_folder', type=str,
+                    help='Path of the work-queue folder, shared by all '
+                    'machines.')
+parser.add_argument('min_share', type=int,
+                    help='Minimum share number of the images to collect '
+                    'sources for.')
+parser.add_argument('pages', type=int,
+                    help='Number of search result pages to go through.')
+parser.add_argument('sleep_min', type=float,
+                    help='Minimum number of seconds between requests to \
+                    Google, for each worker process.')
+parser.add_argument('sleep_max', type=float,
+                    help='Maximum number of seconds between requests to \
+                    Google, for each worker process.')
+parser.add_argument('--fact-check', action='store_true',
+                    help='Fact check the images of the JSON files, writing '
+                    'to fact_checks/, instead of collecting their sources.')
+parser.add_argument('--novelty', type=float, default=None,
+                    help='Stop going through the result pages of an image '
+                    'once the fraction of new registrable domains among the '
+                    'sources of a page falls below this threshold, or once a '
+                    'page has no new domains.')
+parser.add_argument('--stop-at-fact-check', action='store_true',
+                    help='Stop going through the result pages of an image '
+                    'once a fact checker link is found.')
+parser.add_argument('--shards', type=int, default=1,
+                    help='Number of shards each file is split into.')
+parser.add_argument('--processes', type=int, default=1,
+                    help='Number of worker processes on this machine.')
+parser.add_argument('--workers', type=int, default=1,
+                    help='Number of images crawled at the same time by each '
+                    'worker process.')
+parser.add_argument('--rate', type=float, default=None,
+                    help='Maximum number of requests per second, over all '
+                    'hosts, for each worker process.')
+parser.add_argument('--egress', type=str, default='',
+                    help='Comma separated egress points requests are sent '
+                    'through: proxy URLs (http:// or socks5://) or local IP '
+                    'addresses. They are split between the worker processes '
+                    'of this machine, and each one gets its own request '
+                    'budget, so keep at least as many workers per process as '
+                    'egress points per process.')
+parser.add_argument('--stale', type=float, default=3600,
+                    help='Number of seconds without progress after which a '
+                    'claimed task is put back in the queue.')
+parser.add_argument('--cache', type=str, default='http_cache.sqlite',
+                    help='Path of the on-disk HTTP response cache. An empty '
+                    'path disables the cache.')
+parser.add_argument('--verdicts', type=str, default='verdicts.sqlite',
+                    help='Path of the persistent fact checker judgments '
+                    'store. An empty path disables the store.')
+parser.add_argument('--metrics', type=str, default='',
+                    help='Path of a metrics file, rewritten every minute: '
+                    'JSON if it ends with .json, Prometheus text format '
+                    'otherwise. Each worker process writes its own file, '
+                    'named after its machine and index. An empty path '
+                    'disables it.')
+parser.add_argument('--jsonl', action='store_true',
+                    help='Write JSON Lines output files instead of JSON '
+                    'files.')
+
+args = parser.parse_args()
+
+OUTPUT_FOLDER = os.path.join(args.json_folder, 'fact_checks'
+                             if args.fact_check else 'sources')
+TASKS_FOLDER = os.path.join(args.queue_folder, 'tasks')
+CLAIMED_FOLDER = os.path.join(args.queue_folder, 'claimed')
+RESULTS_FOLDER = os.path.join(args.queue_folder, 'results')
+
+
+def get_files():
+    '''
+        Get the input files.
+
+        @return: (string list) Names of the JSON files, sorted.
+    '''
+
+    json_filenames = []
+    for json_f in os.listdir(args.json_folder):
+        if os.path.isfile(os.path.join(args.json_folder, json_f)):
+            if json_f.endswith('.json') or json_f.endswith('.jsonl'):
+                json_filenames.append(json_f)
+
+    return sorted(json_filenames)
+
+
+def get_output_path(json_f):
+    '''
+        Get the path of the merged output file of an input file.
+
+        @json_f: (string) Name of the input file.
+
+        @return: (string) Path of the output file.
+    '''
+
+    output_name = os.path.splitext(json_f)[0] + \
+        ('.jsonl' if args.jsonl else '.json')
+    return os.path.join(OUTPUT_FOLDER, output_name)
+
+
+def get_task_name(json_f, shard):
+    '''
+        Get the name of a task.
+
+        @json_f: (string) Name of the input file.
+        @shard: (int) Shard index.
+
+        @return: (string) Task name.
+    '''
+
+    return '{}.{}-of-{}'.format(json_f, shard, args.shards)
+
+
+def get_result_path(task_name):
+    '''
+        Get the path of the results of a task.
+
+        @task_name: (string) Task name.
+
+        @return: (string) Path of the JSON Lines results file.
+    '''
+
+    return os.path.join(RESULTS_FOLDER, task_name + '.jsonl')
+
+
+def enqueue():
+    '''
+        Create the tasks of the input files that aren't merged yet. Tasks that
+        are queued, claimed or done are left alone, so every machine can run
+        this.
+    '''
+
+    for folder in (OUTPUT_FOLDER, TASKS_FOLDER, CLAIMED_FOLDER,
+                   RESULTS_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+
+    claimed = set(os.listdir(CLAIMED_FOLDER))
+
+    for json_f in get_files():
+        if os.path.exists(get_output_path(json_f)):
+            continue
+
+        for shard in range(args.shards):
+            task_name = get_task_name(json_f, shard)
+
+            if task_name in claimed or \
+                    os.path.exists(get_result_path(task_name)):
+                continue
+
+            task = {'file': json_f, 'shard': shard, 'shards': args.shards}
+
+            try:
+                with open(os.path.join(TASKS_FOLDER, task_name), 'x') as f:
+                    json.dump(task, f)
+            except FileExistsError:
+                pass
+
+
+def requeue_stale():
+    '''
+        Put back in the queue the claimed tasks without progress for too
+        long, e.g., because their worker died.
+    '''
+
+    for task_name in os.listdir(CLAIMED_FOLDER):
+        path = os.path.join(CLAIMED_FOLDER, task_name)
+
+        try:
+            if time() - os.path.getmtime(path) > args.stale:
+                os.rename(path, os.path.join(TASKS_FOLDER, task_name))
+        except OSError:  # Finished or requeued by someone else.
+            pass
+
+
+def claim(skip=()):
+    '''
+        Claim a queued task.
+
+        @skip: (string set) Names of tasks not to claim.
+
+        @return: ((string, dict) tuple) Name and contents of the task, or None
+            if the queue is empty.
+    '''
+
+    for task_name in sorted(os.listdir(TASKS_FOLDER)):
+        if task_name in skip:
+            continue
+
+        path = os.path.join(CLAIMED_FOLDER, task_name)
+
+        try:
+            os.rename(os.path.join(TASKS_FOLDER, task_name), path)
+        except OSError:  # Claimed by another worker.
+            continue
+
+        os.utime(path)
+
+        with open(path, 'r') as f:
+            return task_name, json.load(f)
+
+    return None
+
+
+def needs_crawling(img_data):
+    '''
+        Check if an image has to be crawled.
+
+        @img_data: (dict) Image record.
+
+        @return: (bool) True, iff, the image has to be crawled.
+    '''
+
+    if args.fact_check:
+        return bool(img_data.get('fact_checked'))
+
+    return img_data['shareNumber'] >= args.min_share
+
+
+def fact_check_image(sources):
+    '''
+        Fact check an image.
+
+        @sources: ((string, string) list) Sources of the image.
+
+        @return: (dict) Fact_check field of the image.
+    '''
+
+    return {'fact_check': gc.get_fact_check(sources, args.sleep_min,
+                                            args.sleep_max)}
+
+
+def get_jobs(task, finished, claim_path):
+    '''
+        Go through the images of the shard of a task that still have to be
+        crawled.
+
+        @task: (dict) Task.
+        @finished: (dict) Results of the images finished by a previous run.
+        @claim_path: (string) Path of the claimed task, touched as the shard
+            progresses.
+
+        @return: ((string, tuple) generator) Jobs for scheduler.crawl.
+    '''
+
+    json_f_path = os.path.join(args.json_folder, task['file'])
+    records = json_stream.iter_records(json_f_path)
+
+    for i, (img_id, img_data) in enumerate(records):
+        if i % task['shards'] != task['shard'] or img_id in finished or \
+                not needs_crawling(img_data):
+            continue
+
+        os.utime(claim_path)
+
+        if args.fact_check:
+            yield img_id, (img_data['sources'],)
+        else:
+            yield img_id, (gc.generate_link(img_data), args.sleep_min,
+                           args.sleep_max, args.pages)
+
+
+def run_task(task_name, task):
+    '''
+        Crawl the images of the shard of a task, and write their results.
+
+        @task_name: (string) Task name.
+        @task: (dict) Task.
+
+        @return: (bool) True if the task is done. False if the crawl of some
+            images failed: the task is put back in the queue, keeping the
+            journal of the others.
+    '''
+
+    claim_path = os.path.join(CLAIMED_FOLDER, task_name)
+    result_path = get_result_path(task_name)
+    partial_path = result_path + '.partial'
+
+    # Resume from the images finished by a previous claim of the task.
+    journal_path = checkpoint.get_journal_path(partial_path)
+    finished = checkpoint.load(journal_path)
+    crawl_function = fact_check_image if args.fact_check else \
+        scheduler.crawl_image
+
+    deferred = 0
+
+    with checkpoint.Journal(journal_path) as journal:
+        for img_id, result in scheduler.crawl(
+                get_jobs(task, finished, claim_path), crawl_function,
+                args.workers, args.rate):
+            # Images whose crawl failed are left for a later claim: they
+            # aren't journaled, so it crawls them again.
+            if 'error' in result:
+                deferred += 1
+                continue
+
+            journal.append(img_id, result)
+            finished[img_id] = result
+
+    if deferred:
+        print('[-] {} images of task {} left for a later claim.'.format(
+            deferred, task_name))
+
+        try:
+            os.rename(claim_path, os.path.join(TASKS_FOLDER, task_name))
+        except FileNotFoundError:  # Requeued as stale in the meantime.
+            pass
+
+        return False
+
+    with json_stream.JSONLinesWriter(partial_path) as writer:
+        for img_id, result in finished.items():
+            writer.write(img_id, result)
+
+    os.replace(partial_path, result_path)
+    journal.remove()
+
+    try:
+        os.remove(claim_path)
+    except FileNotFoundError:  # Requeued as stale in the meantime.
+        pass
+
+    return True
+
+
+def merge(json_f):
+    '''
+        Merge the results of all shards of an input file into its output
+        file, if they are all done.
+
+        @json_f: (string) Name of the input file.
+    '''
+
+    output_path = get_output_path(json_f)
+    result_paths = [get_result_path(get_task_name(json_f, shard))
+                    for shard in range(args.shards)]
+
+    if os.path.exists(output_path) or \
+            not all(os.path.exists(path) for path in result_paths):
+        return
+
+    print('[+] Merging {}'.format(json_f))
+    results = {}
+
+    for path in result_paths:
+        results.update(json_stream.iter_records(path))
+
+    # Write to a private file first, so other machines never see a partially
+    # merged output.
+    partial_path = '{}.{}-{}{}'.format(output_path, socket.gethostname(),
+                                       os.getpid(),
+                                       os.path.splitext(output_path)[1])
+
+    with json_stream.open_writer(partial_path) as writer:
+        json_f_path = os.path.join(args.json_folder, json_f)
+
+        for img_id, img_data in json_stream.iter_records(json_f_path):
+            img_data.update(results.get(img_id, {}))
+            writer.write(img_id, img_data)
+
+    os.replace(partial_path, output_path)
+
+
+def work(worker):
+    '''
+        Worker process: run queued tasks until the queue is empty.
+
+        @worker: (int) Worker index on this machine.
+    '''
+
+    egress = [spec for spec in args.egress.split(',') if spec]
+
+    if egress:
+        # Each process gets its share of the egress points, or one of them if
+        # there are fewer egress points than processes.
+        share = egress[worker::max(args.processes, 1)] or \
+            [egress[worker % len(egress)]]
+        gc.set_egress_pool(EgressPool(share, gc.client.headers, args.rate))
+
+    if args.cache:
+        gc.set_cache(HTTPCache(args.cache))
+
+    if args.verdicts:
+        gc.set_verdict_store(VerdictStore(args.verdicts))
+
+    gc.set_pagination(args.novelty, args.stop_at_fact_check)
+
+    if args.metrics:
+        root, ext = os.path.splitext(args.metrics)
+        metrics.start_writer('{}-{}-{}{}'.format(root, socket.gethostname(),
+                                                 worker, ext))
+
+    # Tasks put back in the queue by this worker, left to other workers or
+    # a later run.
+    deferred = set()
+
+    while True:
+        claimed = claim(deferred)
+
+        if claimed is None:
+            break
+
+        task_name, task = claimed
+        print('[+] Worker {} on {}: task {}'.format(
+            worker, socket.gethostname(), task_name))
+
+        if not run_task(task_name, task):
+            deferred.add(task_name)
+
+
+def main():
+    '''
+        Main function.
+    '''
+
+    enqueue()
+    requeue_stale()
+
+    processes = [Process(target=work, args=(worker,))
+                 for worker in range(max(args.processes, 1))]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+    for json_f in get_files():
+        merge(json_f)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+URL parsing shared by every tool. Parsed URLs and hosts are memoized, so the
+same URL is only parsed once per process.
+'''
+
+
+from collections import namedtuple
+from functools import lru_cache
+from ipaddress import ip_address
+from urllib.parse import urlsplit
+
+try:
+    from tldextract import extract
+except ImportError:
+    extract = None
+
+
+# Maximum number of memoized URLs.
+CACHE_SIZE = 1 << 16
+
+# Second-level labels under which domains are registered, used when
+# tldextract isn't installed (e.g., com.br, gov.br, co.uk).
+SECOND_LEVEL_LABELS = {'com', 'org', 'net', 'gov', 'edu', 'co', 'ac', 'jus',
+                       'leg', 'mil', 'art', 'blog', 'nom', 'tv'}
+
+ParsedURL = namedtuple('ParsedURL', ['scheme', 'host', 'domain', 'path'])
+ParsedURL.__doc__ = '''
+    Parsed URL: scheme, host name (lowercase), registrable domain (e.g.,
+    globo.com) and path segments (e.g., ('', ) for the root path, () for no
+    path at all).
+'''
+
+
+def is_ip_address(host):
+    '''
+        Check whether a host is an IP address rather than a host name.
+
+        @host: (string) Host.
+
+        @return: (bool) Whether the host is an IPv4 or IPv6 address.
+    '''
+
+    try:
+        ip_address(host)
+    except ValueError:
+        return False
+
+    return True
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_registrable_domain(host):
+    '''
+        Get the registrable domain of a host, i.e., its public suffix plus
+        one label. IP addresses and hosts without a public suffix (e.g.,
+        localhost) are their own registrable domain.
+
+        @host: (string) Host name.
+
+        @return: (string) Registrable domain.
+    '''
+
+    if '.' not in host or is_ip_address(host):
+        return host
+
+    if extract is not None:
+        result = extract(host)
+        return '.'.join((result.domain, result.suffix)) if result.suffix \
+            else host
+
+    labels = host.split('.')
+
+    if len(labels) >= 3 and len(labels[-1]) == 2 and \
+            labels[-2] in SECOND_LEVEL_LABELS:
+        return '.'.join(labels[-3:])
+
+    return '.'.join(labels[-2:])
+
+
+def get_domain_name(host):
+    '''
+        Get the domain name of a host, without its public suffix (e.g., globo
+        for g1.globo.com).
+
+        @host: (string) Host name.
+
+        @return: (string) Domain name, the whole host for IP addresses and
+            hosts without a public suffix.
+    '''
+
+    if '.' not in host or is_ip_address(host):
+        return host
+
+    return get_registrable_domain(host).split('.')[0]
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_url(url):
+    '''
+        Parse a URL. URLs without a scheme are parsed as if they had one.
+
+        @url: (string) URL.
+
+        @return: (ParsedURL) Parsed URL.
+    '''
+
+    parts = urlsplit(url if '//' in url else '//' + url)
+    host = parts.hostname or ''
+    path = tuple(parts.path.split('/')[1:]) if parts.path else ()
+
+    return ParsedURL(parts.scheme, host, get_registrable_domain(host), path)
+
+
+def get_host(url):
+    '''
+        Get the host name of a URL.
+
+        @url: (string) URL.
+
+        @return: (string) Host name, lowercase.
+    '''
+
+    return parse_url(url).host
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Persistent store of fact checker judgments, keyed by normalized article URL,
+so articles are only fetched and parsed once across runs.
+'''
+
+
+from http_cache import normalize_url
+from threading import Lock
+from time import time
+
+import json
+import sqlite3
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS verdicts (
+    url TEXT PRIMARY KEY,
+    checker TEXT NOT NULL,
+    verdict TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    parser_version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verdicts_checker ON verdicts (checker);
+'''
+
+
+class VerdictStore:
+    '''
+        SQLite backed store of fact checker judgments. A judgment is only
+        valid for the parser version that produced it. Safe to share between
+        threads.
+    '''
+
+    def __init__(self, path):
+        '''
+            @path: (string) Path of the SQLite database file.
+        '''
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def get(self, url, checker, parser_version):
+        '''
+            Get the stored judgment about an article.
+
+            @url: (string) Article URL.
+            @checker: (string) Fact checker.
+            @parser_version: (int) Current version of the fact checker parser.
+
+            @return: (dict) Judgment ('verdict' field), checker, fetch time and
+                parser version of the article, or None if there's no judgment
+                from the current parser version.
+        '''
+
+        with self._lock:
+            row = self._db.execute(
+                'SELECT checker, verdict, fetched_at, parser_version '
+                'FROM verdicts WHERE url = ?',
+                (normalize_url(url),)).fetchone()
+
+        if row is None or row[0] != checker or row[3] != parser_version:
+            return None
+
+        return {'checker': row[0], 'verdict': json.loads(row[1]),
+                'fetched_at': row[2], 'parser_version': row[3]}
+
+    def put(self, url, checker, parser_version, verdict):
+        '''
+            Store the judgment about an article.
+
+            @url: (string) Article URL.
+            @checker: (string) Fact checker.
+            @parser_version: (int) Version of the fact checker parser.
+            @verdict: (bool) Judgment, or None if there's none.
+        '''
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)',
+                (normalize_url(url), checker, json.dumps(verdict), time(),
+                 parser_version))
+            self._db.commit()
+
+    def invalidate(self, checker=None):
+        '''
+            Delete stored judgments.
+
+            @checker: (string) Fact checker whose judgments are deleted. None
+                deletes all judgments.
+        '''
+
+        with self._lock:
+            if checker is None:
+                self._db.execute('DELETE FROM verdicts')
+            else:
+                self._db.execute('DELETE FROM verdicts WHERE checker = ?',
+                                 (checker,))
+
+            self._db.commit()
+
+    def close(self):
+        '''
+            Close the store.
+        '''
+
+        with self._lock:
+            self._db.close()